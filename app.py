@@ -4,19 +4,66 @@
 #  + Per-person one-scan-per-slot-per-day + Device Lock + Member Photo
 #  + Export Logs (Excel / CSV)
 # ================================
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g, has_app_context, make_response, send_file
 
 import mysql.connector
-from datetime import date, datetime
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache, wraps
+from datetime import date, datetime, timedelta
 import secrets
-import qrcode
-from io import BytesIO
+import sys
+import qr_render
+from PIL import Image, ImageDraw, ImageOps
+from io import BytesIO, StringIO, TextIOWrapper
+import atexit
 import base64
+import bisect
+import hashlib
+import json
+import math
+import multiprocessing
 import os
+import queue
+import re
 import calendar
 import csv
+import gzip
+import tempfile
+import threading
+import zipfile
+import zlib
+import time
 import pytz
 from flask_cors import CORS
+from werkzeug.http import http_date
+
+try:
+    import xlsxwriter          # optional: XLSX log export
+except ImportError:
+    xlsxwriter = None
+
+try:
+    import redis               # optional: shared cache for multi-worker mode
+except ImportError:
+    redis = None
+
+try:
+    import brotli              # optional: br-compressed HTML pages
+except ImportError:
+    brotli = None
+
+try:
+    import orjson              # optional: faster JSON for list endpoints
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl               # POSIX: spill file lock shared by all workers
+except ImportError:
+    fcntl = None
 
 app = Flask(__name__)
 CORS(app)
@@ -45,9 +92,665 @@ DB = {
     "port": os.getenv("MYSQL_PORT"),
 }
 
+# -----------------------------
+# CONNECTION POOL CONFIG
+# -----------------------------
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))              # max open connections
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))      # seconds to wait for a free one
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))  # idle seconds before health check
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))   # max connection age in seconds
+
+
+# ============================================================
+#  PERF STATS REGISTRY  (/api/perf-stats)
+#  Each subsystem registers a callable returning a dict.
+# ============================================================
+PERF_STATS = {}
+
+
+def register_stats(name, fn):
+    PERF_STATS[name] = fn
+
+
+@app.route("/api/perf-stats")
+def perf_stats_api():
+    return jsonify({name: fn() for name, fn in PERF_STATS.items()})
+
+
+# ============================================================
+#  INSTRUMENTATION  (/metrics, Server-Timing, /api/profile)
+#  - every request is timed into a histogram per endpoint
+#  - every cursor execute/executemany is timed per statement
+#    fingerprint (literals and placeholders folded to ?)
+#  - span() times other hot spots: pool checkout, QR render,
+#    photo lookups
+#  Within a request the same numbers are summed on g and sent
+#  back as a Server-Timing header.
+# ============================================================
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"   # /api/profile is opt-in
+PROFILE_MAX_SECONDS = 60
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+class Metrics:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}    # (endpoint, method, status) -> count
+        self._latency = {}     # endpoint -> [count per bucket..., +Inf, sum]
+        self._queries = {}     # fingerprint -> [count, seconds, max seconds]
+        self._spans = {}       # name -> [count, seconds]
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            hist = self._latency.get(endpoint)
+            if hist is None:
+                hist = self._latency[endpoint] = [0] * (len(self.buckets) + 1) + [0.0]
+            hist[bisect.bisect_left(self.buckets, seconds)] += 1
+            hist[-1] += seconds
+
+    def observe_query(self, fingerprint, seconds):
+        with self._lock:
+            q = self._queries.get(fingerprint)
+            if q is None:
+                q = self._queries[fingerprint] = [0, 0.0, 0.0]
+            q[0] += 1
+            q[1] += seconds
+            q[2] = max(q[2], seconds)
+
+    def observe_span(self, name, seconds):
+        with self._lock:
+            s = self._spans.setdefault(name, [0, 0.0])
+            s[0] += 1
+            s[1] += seconds
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            requests = dict(self._requests)
+            latency = {k: list(v) for k, v in self._latency.items()}
+            queries = {k: list(v) for k, v in self._queries.items()}
+            spans = {k: list(v) for k, v in self._spans.items()}
+
+        out = ["# TYPE canteen_requests_total counter"]
+        for (endpoint, method, status), n in sorted(requests.items()):
+            out.append(f'canteen_requests_total{{endpoint="{_label(endpoint)}",method="{method}",status="{status}"}} {n}')
+
+        out.append("# TYPE canteen_request_seconds histogram")
+        for endpoint, hist in sorted(latency.items()):
+            ep = _label(endpoint)
+            cumulative = 0
+            for le, n in zip(self.buckets + ("+Inf",), hist[:-1]):
+                cumulative += n
+                out.append(f'canteen_request_seconds_bucket{{endpoint="{ep}",le="{le}"}} {cumulative}')
+            out.append(f'canteen_request_seconds_sum{{endpoint="{ep}"}} {hist[-1]:.6f}')
+            out.append(f'canteen_request_seconds_count{{endpoint="{ep}"}} {cumulative}')
+
+        out.append("# TYPE canteen_db_queries_total counter")
+        out.append("# TYPE canteen_db_query_seconds_total counter")
+        out.append("# TYPE canteen_db_query_max_seconds gauge")
+        for fp, (n, secs, worst) in sorted(queries.items()):
+            label = f'{{query="{_label(fp)}"}}'
+            out.append(f"canteen_db_queries_total{label} {n}")
+            out.append(f"canteen_db_query_seconds_total{label} {secs:.6f}")
+            out.append(f"canteen_db_query_max_seconds{label} {worst:.6f}")
+
+        out.append("# TYPE canteen_span_total counter")
+        out.append("# TYPE canteen_span_seconds_total counter")
+        for name, (n, secs) in sorted(spans.items()):
+            out.append(f'canteen_span_total{{span="{name}"}} {n}')
+            out.append(f'canteen_span_seconds_total{{span="{name}"}} {secs:.6f}')
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics(REQUEST_BUCKETS)
+
+_SQL_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+\b|%s")
+_SQL_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@lru_cache(maxsize=1024)
+def sql_fingerprint(sql):
+    sql = " ".join(sql.split())
+    sql = _SQL_LITERALS.sub("?", sql)
+    return _SQL_IN_LIST.sub("(?, ...)", sql)[:200]
+
+
+def _add_timing(name, seconds):
+    # Per-request totals for Server-Timing (threads have no g)
+    if has_app_context():
+        timings = g.get("timings")
+        if timings is not None:
+            t = timings.setdefault(name, [0, 0.0])
+            t[0] += 1
+            t[1] += seconds
+
+
+@contextmanager
+def span(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        METRICS.observe_span(name, elapsed)
+        _add_timing(name, elapsed)
+
+
+def _observe_query(sql, seconds):
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    METRICS.observe_query(sql_fingerprint(sql), seconds)
+    _add_timing("db", seconds)
+
+
+class InstrumentedCursor:
+    """Times execute/executemany; everything else goes to the real cursor."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def execute(self, operation, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self._cur.execute(operation, *args, **kwargs)
+        finally:
+            _observe_query(operation, time.perf_counter() - t0)
+
+    def executemany(self, operation, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self._cur.executemany(operation, *args, **kwargs)
+        finally:
+            _observe_query(operation, time.perf_counter() - t0)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class InstrumentedConnection:
+    """Hands out InstrumentedCursors; everything else goes to the real connection."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_t0 = time.perf_counter()
+    g.timings = {}
+
+
+@app.after_request
+def finish_request_timer(resp):
+    t0 = g.pop("request_t0", None)
+    if t0 is None:
+        return resp
+    total = time.perf_counter() - t0
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    METRICS.observe_request(endpoint, request.method, resp.status_code, total)
+
+    parts = [
+        f'{name};dur={secs * 1000:.1f};desc="{count}x"'
+        for name, (count, secs) in g.get("timings", {}).items()
+    ]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    resp.headers["Server-Timing"] = ", ".join(parts)
+    return resp
+
+
+@app.route("/metrics")
+def metrics_api():
+    """Prometheus scrape target: request/query/span metrics plus /api/perf-stats numbers."""
+    out = [METRICS.render(), "# TYPE canteen_stat gauge"]
+    for group, fn in PERF_STATS.items():
+        for name, value in fn().items():
+            if isinstance(value, (int, float)):
+                out.append(f'canteen_stat{{group="{group}",name="{name}"}} {float(value)}')
+    return Response("\n".join(out) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+_profile_lock = threading.Lock()
+
+
+def sample_stacks(seconds, interval):
+    """
+    Samples every other thread's stack every `interval` seconds.
+    Returns {"thread;outer;...;inner": samples} (collapsed stacks,
+    ready for flamegraph.pl / speedscope).
+    """
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    counts = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = names.get(ident, str(ident)) + ";" + ";".join(reversed(stack))
+            counts[key] = counts.get(key, 0) + 1
+        time.sleep(interval)
+    return counts
+
+
+@app.route("/api/profile")
+def profile_api():
+    """
+    Opt-in sampling profiler (PROFILER_ENABLED=1).
+    ?seconds=10&interval_ms=5 → collapsed stacks as text, busiest first.
+    """
+    if not PROFILER_ENABLED:
+        return jsonify({"success": False, "error": "Profiler disabled"}), 404
+    try:
+        seconds = min(float(request.args.get("seconds", 10)), PROFILE_MAX_SECONDS)
+        interval = max(float(request.args.get("interval_ms", 5)), 1.0) / 1000
+    except ValueError:
+        return jsonify({"success": False, "error": "Bad seconds / interval_ms"}), 400
+
+    if not _profile_lock.acquire(blocking=False):
+        return jsonify({"success": False, "error": "Profile already running"}), 409
+    try:
+        counts = sample_stacks(seconds, interval)
+    finally:
+        _profile_lock.release()
+
+    lines = [f"{stack} {n}" for stack, n in sorted(counts.items(), key=lambda kv: -kv[1])]
+    return Response("\n".join(lines) + "\n", mimetype="text/plain")
+
+
+# ============================================================
+#  JSON LIST RESPONSES
+#  Roster-sized lists are read with tuple cursors into slotted
+#  row classes and encoded by json_list(): orjson when installed
+#  (it serialises dataclasses natively), else the stdlib. Bodies
+#  over JSON_GZIP_MIN_BYTES are gzipped for clients that accept it.
+# ============================================================
+JSON_GZIP_MIN_BYTES = 1024
+
+
+@dataclass(slots=True)
+class MemberRow:
+    id: int
+    name: str
+    roll_or_id: str
+    allowed_slots: str
+    photo: str | None = None
+
+
+@dataclass(slots=True)
+class MenuRow:
+    id: int
+    title: str
+    description: str
+
+
+@dataclass(slots=True)
+class OverviewRow:
+    id: int
+    name: str
+    used_days: int
+    remaining: int
+    carry_forward: int
+
+
+def _slots_dict(obj):
+    try:
+        return {f: getattr(obj, f) for f in obj.__slots__}
+    except AttributeError:
+        raise TypeError(f"{type(obj).__name__} is not JSON serializable") from None
+
+
+def json_list(rows):
+    if orjson is not None:
+        body = orjson.dumps(rows)
+    else:
+        body = json.dumps(rows, default=_slots_dict, separators=(",", ":")).encode()
+
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= JSON_GZIP_MIN_BYTES and request.accept_encodings["gzip"]:
+        body = gzip.compress(body, 6, mtime=0)    # same rows → same bytes
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
+
+# ============================================================
+#  CONNECTION POOL
+#  - Bounded: at most DB_POOL_SIZE connections, created lazily
+#  - Idle connections are pinged before reuse, old ones recycled
+#  - Callers wait up to DB_POOL_TIMEOUT for a free connection
+# ============================================================
+class PoolTimeout(Exception):
+    """No connection became free within the pool timeout."""
+
+
+class ConnectionPool:
+    def __init__(self, config, size, timeout, ping_after, recycle):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.recycle = recycle
+
+        self._cond = threading.Condition()
+        self._idle = []      # LIFO stack of (conn, last_used)
+        self._born = {}      # id(conn) -> created_at
+        self._open = 0
+        self._counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "health_failures": 0,
+        }
+
+    def _connect(self):
+        conn = InstrumentedConnection(mysql.connector.connect(**self.config))
+        with self._cond:
+            self._born[id(conn)] = time.monotonic()
+            self._counters["created"] += 1
+        return conn
+
+    def _forget(self, conn):
+        """Close a connection and free its slot."""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._born.pop(id(conn), None)
+            self._open -= 1
+            self._cond.notify()
+
+    def _replace(self, conn):
+        """Swap a stale/broken connection for a fresh one (slot is kept)."""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._born.pop(id(conn), None)
+            self._counters["recycled"] += 1
+        return self._connect()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+
+        with self._cond:
+            self._counters["checkouts"] += 1
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    conn = None
+                    break
+                if not waited:
+                    self._counters["waits"] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(f"no free DB connection after {self.timeout}s")
+                self._cond.wait(remaining)
+
+        # Network work happens outside the lock
+        try:
+            if conn is None:
+                return self._connect()
+
+            now = time.monotonic()
+            if now - self._born.get(id(conn), now) > self.recycle:
+                return self._replace(conn)
+
+            if now - last_used > self.ping_after:
+                try:
+                    conn.ping(reconnect=False, attempts=1)
+                except mysql.connector.Error:
+                    with self._cond:
+                        self._counters["health_failures"] += 1
+                    return self._replace(conn)
+            return conn
+        except Exception:
+            # Could not hand out a working connection → give the slot back
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        """Return a connection. Any open transaction is rolled back."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            self._forget(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, conn):
+        """Close a checked-out connection instead of returning it (e.g. it has unread rows)."""
+        self._forget(conn)
+
+    @contextmanager
+    def connection(self):
+        """For code running outside a request (threads, startup tasks)."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                **self._counters,
+            }
+
+
+POOL = ConnectionPool(DB, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER, DB_POOL_RECYCLE)
+register_stats("db_pool", POOL.stats)
+
 
 def db():
-    return mysql.connector.connect(**DB)
+    """
+    Pooled connection for the current request (or app context).
+    Stored on g and released in teardown – callers must NOT close it.
+    """
+    if "db_conn" not in g:
+        with span("db_conn"):
+            g.db_conn = POOL.acquire()
+    return g.db_conn
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        POOL.release(conn)
+
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    return jsonify({"success": False, "message": "Server busy, please retry"}), 503
+
+
+# ============================================================
+#  SHARED CACHE BACKEND
+#  CACHE_BACKEND=memory (default) – per process, fine for one worker
+#  CACHE_BACKEND=redis            – shared by every worker/instance
+#                                   (needs the redis package + REDIS_URL)
+#  Values must be JSON-able. The backend also carries the event bus
+#  used to fan live events out across workers.
+#  Redis errors are logged and treated as cache misses.
+# ============================================================
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "canteen:")
+
+
+class MemoryCache:
+    name = "memory"
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}            # key -> (value, expires_at or None)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def publish(self, channel, message):
+        raise RuntimeError("memory cache has no cross-worker bus")
+
+    def listen(self, callback):
+        raise RuntimeError("memory cache has no cross-worker bus")
+
+
+class RedisCache:
+    name = "redis"
+    shared = True
+
+    EVENT_POLL_SECONDS = 30
+
+    def __init__(self, url, prefix):
+        self.url = url
+        self.prefix = prefix
+        self._r = redis.Redis.from_url(url, decode_responses=True, socket_timeout=1)
+
+    def get(self, key):
+        try:
+            raw = self._r.get(self.prefix + key)
+        except redis.RedisError as e:
+            app.logger.warning("Redis get failed: %s", e)
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        ex = max(1, math.ceil(ttl)) if ttl is not None else None
+        try:
+            self._r.set(self.prefix + key, json.dumps(value, default=str), ex=ex)
+        except redis.RedisError as e:
+            app.logger.warning("Redis set failed: %s", e)
+
+    def delete(self, key):
+        try:
+            self._r.delete(self.prefix + key)
+        except redis.RedisError as e:
+            app.logger.warning("Redis delete failed: %s", e)
+
+    def publish(self, channel, message):
+        try:
+            self._r.publish(self.prefix + "events", json.dumps({"channel": channel, "message": message}))
+        except redis.RedisError as e:
+            app.logger.warning("Redis publish failed: %s", e)
+
+    def listen(self, callback):
+        """
+        Calls callback(channel, message) for every bus message, on a daemon
+        thread. The subscriber has its own client: its socket sits idle
+        between events, so the 1 s command timeout would drop it over and
+        over. A dead connection is caught by the health check PING that
+        redis-py sends on the get_message() after an idle interval.
+        """
+        sub = redis.Redis.from_url(
+            self.url, decode_responses=True, socket_timeout=None,
+            health_check_interval=self.EVENT_POLL_SECONDS,
+        )
+
+        def run():
+            while True:
+                pubsub = sub.pubsub(ignore_subscribe_messages=True)
+                try:
+                    pubsub.subscribe(self.prefix + "events")
+                    while True:
+                        item = pubsub.get_message(timeout=self.EVENT_POLL_SECONDS)
+                        if item is None:
+                            continue
+                        payload = json.loads(item["data"])
+                        callback(payload["channel"], payload["message"])
+                except redis.RedisError as e:
+                    app.logger.warning("Redis event bus dropped (%s), reconnecting", e)
+                    time.sleep(1)
+                finally:
+                    pubsub.close()
+
+        threading.Thread(target=run, name="redis-events", daemon=True).start()
+
+
+def make_cache():
+    if CACHE_BACKEND == "redis":
+        if redis is None:
+            app.logger.warning("CACHE_BACKEND=redis but the redis package is missing; using memory")
+        else:
+            return RedisCache(REDIS_URL, CACHE_PREFIX)
+    return MemoryCache()
+
+
+CACHE = make_cache()
+
+
+@contextmanager
+def advisory_lock(name, wait):
+    """
+    MySQL GET_LOCK on the request connection – serialises work across
+    workers and instances. Yields True if the lock was taken.
+    """
+    cur = db().cursor()
+    cur.execute("SELECT GET_LOCK(%s, %s)", (name, wait))
+    got = cur.fetchone()[0] == 1
+    try:
+        yield got
+    finally:
+        if got:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (name,))
+            cur.fetchone()
+        cur.close()
 
 
 # -----------------------------
@@ -58,61 +761,793 @@ def get_days_in_month(year, month):
 
 
 # -----------------------------
-# HELPER: MEMBER PHOTO URL
+# HELPER: PHOTO INDEX (member photos + menu photo)
 # -----------------------------
-def get_member_photo_url(member_id: int):
+PHOTO_EXTS = ("jpg", "jpeg", "png")      # accepted uploads, lookup preference order
+PHOTO_INDEX_RECHECK = 2.0                # seconds between directory mtime checks
+
+# Re-encoded variants: <name>-<size>-<hash>.jpg, max side in px
+MEMBER_PHOTO_SIZES = {"thumb": 240, "display": 720}
+MENU_PHOTO_SIZES = {"thumb": 320, "display": 1280}
+VARIANT_RE = re.compile(r"^(?P<name>.+)-(?P<size>[a-z]+)-(?P<hash>[0-9a-f]{12})\.jpg$")
+
+
+class PhotoIndex:
+    """
+    In-memory view of <folder>, built with one os.scandir:
+      - variants: <name>-<size>-<hash>.jpg written by the image pipeline
+      - legacy:   <name>.<jpg|jpeg|png> uploaded before the pipeline existed
+    Our own writes/deletes update it directly; files changed on disk by
+    hand are caught by the directory mtime check. With `names`, only
+    those photo names are indexed (other images in the folder are
+    site assets, not uploads).
+    """
+
+    def __init__(self, folder, url_prefix, sizes, names=None):
+        self.folder = folder
+        self.url_prefix = url_prefix
+        self.sizes = sizes
+        self.names = names
+        self._lock = threading.Lock()
+        self._legacy = {}          # name -> ext
+        self._variants = {}        # name -> {size: filename}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._counters = {"lookups": 0, "rescans": 0}
+        self._generation = 0       # bumped on every change
+        self._rescan()
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _rescan(self):
+        legacy, variants = {}, {}
+        mtime = self._dir_mtime()
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if not entry.is_file():
+                        continue
+                    m = VARIANT_RE.match(entry.name)
+                    if m and m["size"] in self.sizes:
+                        if self.names is None or m["name"] in self.names:
+                            variants.setdefault(m["name"], {})[m["size"]] = entry.name
+                        continue
+                    name, dot, ext = entry.name.rpartition(".")
+                    ext = ext.lower()
+                    if not dot or ext not in PHOTO_EXTS:
+                        continue
+                    if self.names is not None and name not in self.names:
+                        continue
+                    old = legacy.get(name)
+                    if old is None or PHOTO_EXTS.index(ext) < PHOTO_EXTS.index(old):
+                        legacy[name] = ext
+        except FileNotFoundError:
+            pass
+        self._legacy, self._variants = legacy, variants
+        self._mtime = mtime
+        self._counters["rescans"] += 1
+        self._generation += 1
+
+    def _maybe_rescan(self):
+        now = time.monotonic()
+        if now - self._checked_at < PHOTO_INDEX_RECHECK:
+            return
+        self._checked_at = now
+        if self._dir_mtime() != self._mtime:
+            self._rescan()
+
+    def get(self, name, size="display"):
+        """URL for name (re-encoded variant if there is one), or None."""
+        name = str(name)
+        with span("photo"), self._lock:
+            self._maybe_rescan()
+            self._counters["lookups"] += 1
+            filename = self._variants.get(name, {}).get(size)
+            if filename is None and name in self._legacy:
+                filename = f"{name}.{self._legacy[name]}"
+        return f"{self.url_prefix}/{filename}" if filename else None
+
+    def names_without_variants(self):
+        with self._lock:
+            return [n for n in self._legacy if n not in self._variants]
+
+    def legacy_path(self, name):
+        with self._lock:
+            ext = self._legacy.get(str(name))
+        return os.path.join(self.folder, f"{name}.{ext}") if ext else None
+
+    def _delete_files(self, name):
+        for ext in PHOTO_EXTS:
+            try:
+                os.remove(os.path.join(self.folder, f"{name}.{ext}"))
+            except OSError:
+                pass
+        for filename in self._variants.get(name, {}).values():
+            try:
+                os.remove(os.path.join(self.folder, filename))
+            except OSError:
+                pass
+        self._legacy.pop(name, None)
+        self._variants.pop(name, None)
+
+    def remove(self, name):
+        """Delete every file for name and forget it."""
+        with self._lock:
+            self._delete_files(str(name))
+            self._mtime = self._dir_mtime()
+            self._generation += 1
+
+    def publish(self, name, encoded, keep_legacy=False):
+        """
+        Store freshly encoded variants {size: jpeg bytes} under content-hashed
+        names and drop the previous files for name.
+        """
+        name = str(name)
+        new = {}
+        for size, data in encoded.items():
+            filename = f"{name}-{size}-{hashlib.sha1(data).hexdigest()[:12]}.jpg"
+            tmp = os.path.join(self.folder, f".{filename}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.folder, filename))
+            new[size] = filename
+
+        with self._lock:
+            legacy_ext = self._legacy.get(name)
+            old = {f for f in self._variants.get(name, {}).values() if f not in new.values()}
+            if not keep_legacy:
+                for ext in PHOTO_EXTS:
+                    try:
+                        os.remove(os.path.join(self.folder, f"{name}.{ext}"))
+                    except OSError:
+                        pass
+                self._legacy.pop(name, None)
+            elif legacy_ext:
+                self._legacy[name] = legacy_ext
+            for filename in old:
+                try:
+                    os.remove(os.path.join(self.folder, filename))
+                except OSError:
+                    pass
+            self._variants[name] = new
+            self._mtime = self._dir_mtime()
+            self._generation += 1
+
+    def generation(self):
+        """Changes whenever lookups could answer differently (response cache keys)."""
+        with self._lock:
+            self._maybe_rescan()
+            return self._generation
+
+    def stats(self):
+        with self._lock:
+            return {"legacy": len(self._legacy), "variants": len(self._variants), **self._counters}
+
+
+MEMBER_PHOTOS = PhotoIndex(MEMBERS_FOLDER, "/static/members", MEMBER_PHOTO_SIZES)
+# The menu photo sits in static/ itself, next to the site's assets
+MENU_PHOTOS = PhotoIndex(app.config["UPLOAD_FOLDER"], "/static", MENU_PHOTO_SIZES, names={"menu"})
+register_stats("member_photos", MEMBER_PHOTOS.stats)
+
+
+def get_member_photo_url(member_id: int, size="thumb"):
     """
-    Looks for static/members/<member_id>.jpg / .jpeg / .png.
+    Member photo from the photo index (small variant by default).
     Returns URL string or None.
     """
-    for ext in ("jpg", "jpeg", "png"):
-        path = os.path.join(MEMBERS_FOLDER, f"{member_id}.{ext}")
-        if os.path.exists(path):
-            return f"/static/members/{member_id}.{ext}"
-    return None
+    return MEMBER_PHOTOS.get(member_id, size)
+
+
+# -----------------------------
+# IMAGE PIPELINE
+# Uploads are re-encoded to fixed JPEG sizes on a worker thread:
+# orientation applied, EXIF and other metadata dropped.
+# -----------------------------
+IMAGE_WORKERS = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image")
+_image_counters = {"processed": 0, "failed": 0, "encode_ms_total": 0.0}
+
+
+def encode_photo_variants(data, sizes):
+    """Returns {size: jpeg bytes}. No metadata is written to the output."""
+    with Image.open(BytesIO(data)) as src:
+        img = ImageOps.exif_transpose(src)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            bg = Image.new("RGB", img.size, (255, 255, 255))
+            bg.paste(img, mask=img.getchannel("A"))
+            img = bg
+        else:
+            img = img.convert("RGB")
+
+    out = {}
+    for size, max_side in sizes.items():
+        variant = img.copy()
+        variant.thumbnail((max_side, max_side), Image.LANCZOS)
+        buf = BytesIO()
+        variant.save(buf, "JPEG", quality=82, optimize=True, progressive=True)
+        out[size] = buf.getvalue()
+    return out
+
+
+def _process_photo(index, name, data, keep_legacy):
+    t0 = time.perf_counter()
+    try:
+        index.publish(name, encode_photo_variants(data, index.sizes), keep_legacy)
+        _image_counters["processed"] += 1
+    except Exception:
+        _image_counters["failed"] += 1
+        app.logger.exception("Photo processing failed for %s/%s", index.folder, name)
+    _image_counters["encode_ms_total"] += (time.perf_counter() - t0) * 1000
+
+
+def submit_photo(index, name, data, keep_legacy=False):
+    """Queue an upload (raw bytes) for re-encoding; returns the Future."""
+    return IMAGE_WORKERS.submit(_process_photo, index, name, data, keep_legacy)
+
+
+def read_image_upload(file):
+    """
+    Reads an uploaded photo and checks it really is an image.
+    Returns bytes, or None if it can't be read or Pillow can't identify it.
+    """
+    try:
+        data = file.read()
+        with Image.open(BytesIO(data)) as img:
+            img.verify()
+    except Exception:
+        return None
+    return data
+
+
+def backfill_photo_variants():
+    """Photos saved before the pipeline get variants (originals are kept)."""
+    for index in (MEMBER_PHOTOS, MENU_PHOTOS):
+        for name in index.names_without_variants():
+            path = index.legacy_path(name)
+            try:
+                with open(path, "rb") as f:
+                    submit_photo(index, name, f.read(), keep_legacy=True)
+            except OSError:
+                pass
+
+
+def image_stats():
+    c = _image_counters
+    return {
+        "processed": c["processed"],
+        "failed": c["failed"],
+        "avg_encode_ms": round(c["encode_ms_total"] / c["processed"], 1) if c["processed"] else None,
+    }
+
+
+register_stats("images", image_stats)
+
+
+@app.after_request
+def immutable_static_cache(resp):
+    # Content-hashed photo variants and ?v=<hash> asset URLs never
+    # change → cache forever
+    if request.path.startswith("/static/"):
+        filename = request.path.rsplit("/", 1)[-1]
+        version = request.args.get("v")
+        if VARIANT_RE.match(filename) or (version and version == PAGES.asset_version(filename)):
+            resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
+
+# ============================================================
+#  RESPONSE CACHE (ETag / 304)
+#  GET bodies of read-mostly endpoints are kept in memory, keyed
+#  by path, query string, accepted encoding and the current value
+#  of every version they depend on. Mutating endpoints bump those
+#  versions in the shared cache (so every worker sees it), which
+#  retires old entries without a scan; they age out of the LRU
+#  once RESPONSE_CACHE_BYTES is used up.
+#  With the per-process memory backend a bump only reaches the
+#  worker that made it, so entries then also expire after
+#  RESPONSE_CACHE_LOCAL_TTL seconds: other workers (or instances)
+#  are stale for at most that long.
+#  Versions: "members", "usage", "menu" (shared counters) and
+#  "member_photos", "menu_photo" (photo index generations).
+# ============================================================
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(8 * 1024 * 1024)))
+RESPONSE_CACHE_LOCAL_TTL = float(os.getenv("RESPONSE_CACHE_LOCAL_TTL", "5"))
+
+
+class ResponseCache:
+    def __init__(self, cache, max_bytes, ttl=None):
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.ttl = ttl                # None: entries live until a bump or eviction
+        self._lock = threading.Lock()
+        self._items = OrderedDict()   # key -> (body, etag, headers, expires_at)
+        self._bytes = 0
+        self._local_versions = {}     # name -> callable, for per-process sources
+        self._counters = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0, "bumps": 0}
+
+    def local_version(self, name, fn):
+        self._local_versions[name] = fn
+
+    def version(self, name):
+        fn = self._local_versions.get(name)
+        if fn is not None:
+            return fn()
+        return self.cache.get(f"resp_version:{name}") or 0
+
+    def bump(self, *names):
+        for name in names:
+            self.cache.set(f"resp_version:{name}", time.time_ns())
+        self._counters["bumps"] += 1
+
+    def _store(self, key, entry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old:
+                self._bytes -= len(old[0])
+            self._items[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted[0])
+                self._counters["evictions"] += 1
+
+    def respond(self, deps, view, args, kwargs):
+        encoding = "gzip" if request.accept_encodings["gzip"] else ""
+        key = (request.path, request.query_string, encoding, tuple(self.version(d) for d in deps))
+
+        with self._lock:
+            entry = self._items.get(key)
+            if entry and entry[3] is not None and entry[3] < time.monotonic():
+                entry = None
+            if entry:
+                self._items.move_to_end(key)
+                self._counters["hits"] += 1
+            else:
+                self._counters["misses"] += 1
+
+        if entry is None:
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200 or resp.is_streamed:
+                return resp
+            body = resp.get_data()
+            headers = {h: resp.headers[h] for h in ("Content-Type", "Content-Encoding", "Vary") if h in resp.headers}
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+            # ETag from the uncompressed content, suffixed per encoding
+            # (as PageCache does): a rebuilt, unchanged list keeps its ETag
+            content = gzip.decompress(body) if headers.get("Content-Encoding") == "gzip" else body
+            etag = hashlib.sha1(content).hexdigest()[:16] + ("-gz" if content is not body else "")
+            entry = (body, etag, headers, expires_at)
+            self._store(key, entry)
+
+        body, etag, headers, _ = entry
+        cache_headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if request.if_none_match.contains(etag):
+            self._counters["not_modified"] += 1
+            return Response(status=304, headers=cache_headers)
+        return Response(body, headers={**headers, **cache_headers})
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes, "ttl": self.ttl, **self._counters}
+
+
+RESPONSES = ResponseCache(CACHE, RESPONSE_CACHE_BYTES, ttl=None if CACHE.shared else RESPONSE_CACHE_LOCAL_TTL)
+RESPONSES.local_version("member_photos", MEMBER_PHOTOS.generation)
+RESPONSES.local_version("menu_photo", MENU_PHOTOS.generation)
+register_stats("responses", RESPONSES.stats)
+
+
+def cached_response(*deps):
+    """Serve GETs of the view through RESPONSES; other methods pass straight through."""
+    def wrap(view):
+        @wraps(view)
+        def inner(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            return RESPONSES.respond(deps, view, args, kwargs)
+        return inner
+    return wrap
 
 
 # ============================================================
 #  FRONTEND ROUTES
+#  HTML pages are read once, pre-compressed (gzip, and br when the
+#  brotli package is installed) and re-read only when the file or
+#  one of its /static/ assets changes on disk. References to
+#  top-level /static/ files get ?v=<content hash> appended, so the
+#  assets can be cached forever. Pages themselves are revalidated
+#  on every load: a reload costs a 304.
 # ============================================================
+STATIC_ASSET_RE = re.compile(r"""(["'(])/static/([\w.-]+)(?=["')])""")
+
+
+def _content_hash(data):
+    return hashlib.sha1(data).hexdigest()[:12]
+
+
+class PageCache:
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._lock = threading.Lock()
+        self._pages = {}           # path -> entry
+        self._assets = {}          # filename -> (mtime, hash)
+        self._counters = {"loads": 0, "hits": 0, "not_modified": 0}
+
+    def asset_version(self, filename):
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._assets.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as f:
+            version = _content_hash(f.read())
+        with self._lock:
+            self._assets[filename] = (mtime, version)
+        return version
+
+    def _mtimes(self, paths):
+        out = {}
+        for p in paths:
+            try:
+                out[p] = os.stat(p).st_mtime_ns
+            except OSError:
+                out[p] = None
+        return out
+
+    def _load(self, path):
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+
+        assets = []
+
+        def version_url(m):
+            quote, filename = m.groups()
+            version = self.asset_version(filename)
+            if version is None:
+                return m.group(0)
+            assets.append(os.path.join(self.static_folder, filename))
+            return f"{quote}/static/{filename}?v={version}"
+
+        body = STATIC_ASSET_RE.sub(version_url, html).encode("utf-8")
+        etag = _content_hash(body)
+        entry = {
+            "deps": self._mtimes([path] + assets),
+            "bodies": {
+                None: (body, etag),
+                "gzip": (gzip.compress(body, 9, mtime=0), f"{etag}-gz"),
+            },
+        }
+        if brotli is not None:
+            entry["bodies"]["br"] = (brotli.compress(body), f"{etag}-br")
+        self._counters["loads"] += 1
+        return entry
+
+    def get(self, path):
+        with self._lock:
+            entry = self._pages.get(path)
+        if entry is None or self._mtimes(entry["deps"]) != entry["deps"]:
+            entry = self._load(path)
+            with self._lock:
+                self._pages[path] = entry
+        return entry
+
+    def response(self, path):
+        entry = self.get(path)
+        bodies = entry["bodies"]
+        encoding = None
+        for enc in ("br", "gzip"):
+            if enc in bodies and request.accept_encodings[enc]:
+                encoding = enc
+                break
+        body, etag = bodies[encoding]
+
+        headers = {
+            "ETag": f'"{etag}"',
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        if request.if_none_match.contains(etag):
+            self._counters["not_modified"] += 1
+            return Response(status=304, headers=headers)
+        self._counters["hits"] += 1
+        return Response(body, mimetype="text/html", headers=headers)
+
+    def stats(self):
+        return {"pages": len(self._pages), "assets": len(self._assets), **self._counters}
+
+
+PAGES = PageCache(app.config["UPLOAD_FOLDER"])
+register_stats("pages", PAGES.stats)
+
+
 @app.route("/")
 def student_page():
     # Student main page (scanner + summary + menu photo)
-    return open("index.html", encoding="utf-8").read()
+    return PAGES.response("index.html")
 
 
 @app.route("/admin2025-mess")
 def admin_page():
     # Main admin dashboard
-    return open("admin2025-mess.html", encoding="utf-8").read()
+    return PAGES.response("admin2025-mess.html")
 
 
 @app.route("/admin2025-mess/qr")
 def admin_qr_page():
     # Dedicated QR page for admin (slot-based QR)
-    return open("admin2025-qr.html", encoding="utf-8").read()
+    return PAGES.response("admin2025-qr.html")
 
 
 # ============================================================
-#  HELPER: CURRENT SLOT (AUTO)
+#  SLOT SCHEDULE (IST)
+#  Slot times come from the slot_schedule table, else the
+#  SLOT_SCHEDULE env var (JSON), else DEFAULT_SLOT_SCHEDULE.
+#  They are compiled into a minute-by-minute table for the whole
+#  week, so "which slot is it and when does it end" is O(1).
 # ============================================================
+SLOTS = ("morning", "afternoon", "evening", "night")   # also mess_days column names
+
+# slot, start, end ("HH:MM", end exclusive, may wrap past midnight)
+DEFAULT_SLOT_SCHEDULE = [
+    {"slot": "morning", "start": "06:00", "end": "11:00"},
+    {"slot": "afternoon", "start": "11:00", "end": "15:00"},
+    {"slot": "evening", "start": "15:00", "end": "18:00"},
+    {"slot": "night", "start": "18:00", "end": "06:00"},
+]
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _to_minutes(value):
+    """'HH:MM' / 'HH:MM:SS' string or MySQL TIME (timedelta) → minute of day."""
+    if isinstance(value, timedelta):
+        return int(value.total_seconds() // 60) % MINUTES_PER_DAY
+    parts = [int(p) for p in str(value).split(":")]
+    return (parts[0] * 60 + parts[1]) % MINUTES_PER_DAY
+
+
+class SlotSchedule:
+    """
+    Entries: {"slot", "start", "end", optional "weekday" (0=Mon … 6=Sun,
+    missing/None = every day)}. Later entries win where they overlap,
+    so weekday-specific rows can be listed after the daily ones.
+    """
+
+    def __init__(self, entries, source):
+        self.entries = entries
+        self.source = source
+        week = [None] * MINUTES_PER_WEEK
+        for e in entries:
+            if e["slot"] not in SLOTS:
+                raise ValueError(f"unknown slot {e['slot']!r} in schedule")
+            start, end = _to_minutes(e["start"]), _to_minutes(e["end"])
+            length = (end - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+            days = range(7) if e.get("weekday") is None else [int(e["weekday"])]
+            for d in days:
+                base = d * MINUTES_PER_DAY + start
+                for i in range(length):
+                    week[(base + i) % MINUTES_PER_WEEK] = e["slot"]
+        self._slot_at = week
+
+        # Minutes until the slot changes, walking backwards twice round
+        # the week so runs that wrap Sunday → Monday are measured right.
+        until = [MINUTES_PER_WEEK] * MINUTES_PER_WEEK
+        run = MINUTES_PER_WEEK
+        for i in range(2 * MINUTES_PER_WEEK - 1, -1, -1):
+            m, nxt = i % MINUTES_PER_WEEK, (i + 1) % MINUTES_PER_WEEK
+            run = run + 1 if week[m] == week[nxt] else 1
+            until[m] = min(run, MINUTES_PER_WEEK)
+        self._minutes_left = until
+
+    def at(self, now):
+        """(slot or None, seconds until the next slot boundary) for an aware datetime."""
+        now = now.astimezone(IST)
+        m = now.weekday() * MINUTES_PER_DAY + now.hour * 60 + now.minute
+        seconds_left = self._minutes_left[m] * 60 - now.second - now.microsecond / 1e6
+        return self._slot_at[m], seconds_left
+
+
+def _schedule_from_env():
+    raw = os.getenv("SLOT_SCHEDULE")
+    if not raw:
+        return None
+    try:
+        return SlotSchedule(json.loads(raw), "env")
+    except (ValueError, KeyError, TypeError) as e:
+        app.logger.warning("Ignoring bad SLOT_SCHEDULE: %s", e)
+        return None
+
+
+SCHEDULE = _schedule_from_env() or SlotSchedule(DEFAULT_SLOT_SCHEDULE, "default")
+
+
+def load_slot_schedule(cur):
+    """Startup: use slot_schedule rows if the table has any."""
+    global SCHEDULE
+    cur.execute("SELECT weekday, slot, start_time, end_time FROM slot_schedule ORDER BY weekday IS NOT NULL, id")
+    rows = cur.fetchall()
+    if rows:
+        entries = [{"weekday": wd, "slot": s, "start": st, "end": en} for wd, s, st, en in rows]
+        SCHEDULE = SlotSchedule(entries, "db")
+
+
+def seconds_to_date_change(now):
+    """Seconds until the server date (date.today(), which keys slot tokens) rolls over."""
+    midnight = datetime.combine(now.astimezone().date() + timedelta(days=1), datetime.min.time())
+    return midnight.timestamp() - now.timestamp()
+
+
+def current_slot_info(now=None):
+    """
+    (slot, seconds until it changes). The server date changing counts
+    as a change too: the night slot runs past midnight, and its token
+    for the new date is a different one.
+    """
+    now = now or datetime.now(IST)
+    slot, seconds_left = SCHEDULE.at(now)
+    return slot, min(seconds_left, seconds_to_date_change(now))
+
 
 def get_current_slot():
-    now=datetime.now(IST)
-    h = now.hour
-    if 6 <= h < 11:
-        return "morning"
-    elif 11 <= h < 3:
-        return "afternoon"
-    elif  3 <= h < 6:
-        return "evening"
-    else:
-        return "night"
+    return current_slot_info()[0]
 
 
 @app.route("/api/current-slot")
 def current_slot_api():
-    return jsonify({"slot": get_current_slot()})
+    now = datetime.now(IST)
+    slot, seconds_left = current_slot_info(now)
+    return jsonify({
+        "slot": slot,
+        "next_change_in": round(seconds_left),
+        "next_change_at": (now + timedelta(seconds=seconds_left)).replace(microsecond=0).isoformat(),
+    })
+
+
+@app.route("/api/slot-schedule", methods=["GET", "POST"])
+def slot_schedule_api():
+    """GET → active schedule. POST → reload it from the slot_schedule table."""
+    if request.method == "POST":
+        cur = db().cursor()
+        try:
+            load_slot_schedule(cur)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        finally:
+            cur.close()
+        SLOT_TOKENS.invalidate()
+
+    entries = [
+        {**e, "start": str(e["start"]), "end": str(e["end"])} for e in SCHEDULE.entries
+    ]
+    return jsonify({"source": SCHEDULE.source, "entries": entries})
+
+
+# ============================================================
+#  ROLL NUMBER INDEX
+#  roll_or_id → {id, name, device_id} for every member, loaded with
+#  one query and refreshed every MEMBER_INDEX_REFRESH seconds.
+#  Member add/delete on this worker update it directly. Answers the
+#  index can't vouch for (unknown roll, device mismatch) are re-read
+#  from the DB first, so a stale entry never rejects a login.
+# ============================================================
+MEMBER_INDEX_REFRESH = int(os.getenv("MEMBER_INDEX_REFRESH", "300"))
+
+
+class RollIndex:
+    def __init__(self, refresh_seconds):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._by_roll = {}
+        self._loaded_at = None
+        self._counters = {"hits": 0, "misses": 0, "reloads": 0, "binds": 0, "bind_conflicts": 0}
+
+    def load(self, cur=None):
+        own = cur is None
+        if own:
+            cur = db().cursor()
+        cur.execute("SELECT id, roll_or_id, name, device_id FROM members")
+        by_roll = {
+            roll: {"id": mid, "name": name, "device_id": device}
+            for mid, roll, name, device in cur.fetchall()
+        }
+        if own:
+            cur.close()
+        with self._lock:
+            self._by_roll = by_roll
+            self._loaded_at = time.monotonic()
+            self._counters["reloads"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def fetch(self, roll):
+        """Re-read one member from the DB and update the index."""
+        cur = db().cursor(dictionary=True)
+        cur.execute("SELECT id, name, device_id FROM members WHERE roll_or_id = %s", (roll,))
+        row = cur.fetchone()
+        cur.close()
+        with self._lock:
+            if row:
+                self._by_roll[roll] = dict(row)
+            else:
+                self._by_roll.pop(roll, None)
+        return row
+
+    def get(self, roll):
+        if not roll:
+            return None
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_seconds:
+            self.load()
+        with self._lock:
+            row = self._by_roll.get(roll)
+            self._counters["hits" if row else "misses"] += 1
+        if row is None:
+            return self.fetch(roll)
+        return dict(row)
+
+    def put(self, roll, member_id, name, device_id=None):
+        with self._lock:
+            self._by_roll[roll] = {"id": member_id, "name": name, "device_id": device_id}
+
+    def remove(self, member_id):
+        with self._lock:
+            for roll in [r for r, row in self._by_roll.items() if row["id"] == member_id]:
+                del self._by_roll[roll]
+
+    def bind_device(self, roll, member_id, device_id):
+        """
+        Lock the member to device_id if no device holds it yet, with one
+        conditional UPDATE. Returns the device holding the lock afterwards
+        (device_id itself if we won).
+        """
+        c = db()
+        cur = c.cursor()
+        cur.execute(
+            """
+            UPDATE members SET device_id=%s
+            WHERE id=%s AND (device_id IS NULL OR device_id = '')
+            """,
+            (device_id, member_id),
+        )
+        won = cur.rowcount == 1
+        c.commit()
+        cur.close()
+
+        if won:
+            with self._lock:
+                self._counters["binds"] += 1
+                if roll in self._by_roll:
+                    self._by_roll[roll]["device_id"] = device_id
+            return device_id
+
+        self._counters["bind_conflicts"] += 1
+        row = self.fetch(roll)
+        return row["device_id"] if row else None
+
+    def stats(self):
+        with self._lock:
+            return {"members": len(self._by_roll), **self._counters}
+
+
+ROLLS = RollIndex(MEMBER_INDEX_REFRESH)
+register_stats("login_index", ROLLS.stats)
 
 
 # ============================================================
@@ -128,13 +1563,7 @@ def login_api():
     roll = request.args.get("roll")
     device_id = request.args.get("device_id")  # can be null / empty
 
-    c = db()
-    cur = c.cursor(dictionary=True)
-    cur.execute("SELECT id, name, device_id FROM members WHERE roll_or_id = %s", (roll,))
-    row = cur.fetchone()
-    cur.close()
-    c.close()
-
+    row = ROLLS.get(roll)
     if not row:
         return jsonify({"success": False, "message": "Invalid roll number"})
 
@@ -150,37 +1579,31 @@ def login_api():
             "locked": bool(current_device)
         })
 
-    # If member already locked to some device
-    if current_device:
-        if current_device == device_id:
-            # Same device – allow
-            return jsonify({
-                "success": True,
-                "member_id": member_id,
-                "name": row["name"],
-                "locked": True
-            })
-        else:
-            # Different device – block
-            return jsonify({
-                "success": False,
-                "locked": True,
-                "message": "This account is already used on another device. Contact admin."
-            })
-
-    # Not locked yet + device_id provided → lock account to this device
-    c2 = db()
-    cur2 = c2.cursor()
-    cur2.execute("UPDATE members SET device_id=%s WHERE id=%s", (device_id, member_id))
-    c2.commit()
-    cur2.close()
-    c2.close()
+    # Index may be stale (lock cleared by admin) – confirm before refusing
+    if current_device and current_device != device_id:
+        row = ROLLS.fetch(roll)
+        if not row:
+            return jsonify({"success": False, "message": "Invalid roll number"})
+        current_device = row.get("device_id")
+
+    # Not locked yet → lock account to this device; the conditional
+    # UPDATE decides between devices logging in at the same time
+    if not current_device:
+        current_device = ROLLS.bind_device(roll, member_id, device_id)
+
+    if current_device == device_id:
+        return jsonify({
+            "success": True,
+            "member_id": member_id,
+            "name": row["name"],
+            "locked": True
+        })
 
+    # Different device – block
     return jsonify({
-        "success": True,
-        "member_id": member_id,
-        "name": row["name"],
-        "locked": True
+        "success": False,
+        "locked": True,
+        "message": "This account is already used on another device. Contact admin."
     })
 
 
@@ -188,15 +1611,15 @@ def login_api():
 #  MENU APIs (TEXT) – still available (not used much now)
 # ============================================================
 @app.route("/api/menu", methods=["GET", "POST"])
+@cached_response("menu")
 def menu():
     if request.method == "GET":
         c = db()
-        cur = c.cursor(dictionary=True)
-        cur.execute("SELECT * FROM menu WHERE available=1")
-        rows = cur.fetchall()
+        cur = c.cursor()
+        cur.execute("SELECT id, title, description FROM menu WHERE available=1")
+        rows = [MenuRow(*r) for r in cur.fetchall()]
         cur.close()
-        c.close()
-        return jsonify(rows)
+        return json_list(rows)
 
     data = request.get_json()
     title = data["title"]
@@ -207,7 +1630,7 @@ def menu():
     cur.execute("INSERT INTO menu(title,description) VALUES(%s,%s)", (title, desc))
     c.commit()
     cur.close()
-    c.close()
+    RESPONSES.bump("menu")
 
     return jsonify({"status": "saved"})
 
@@ -219,7 +1642,7 @@ def delete_menu(item_id):
     cur.execute("DELETE FROM menu WHERE id=%s", (item_id,))
     c.commit()
     cur.close()
-    c.close()
+    RESPONSES.bump("menu")
     return jsonify({"status": "deleted"})
 
 
@@ -229,8 +1652,9 @@ def delete_menu(item_id):
 @app.route("/api/upload-menu-photo", methods=["POST"])
 def upload_menu_photo():
     """
-    Admin uploads today's menu image.
-    Saves as static/menu.<ext> and returns URL.
+    Admin uploads today's menu image. It is re-encoded in the
+    background, so "url" is null until then; /api/menu-photo has the
+    new URL once the variants are written.
     """
     if "photo" not in request.files:
         return jsonify({"success": False, "error": "No file part"}), 400
@@ -243,56 +1667,42 @@ def upload_menu_photo():
         return jsonify({"success": False, "error": "Invalid filename"}), 400
 
     ext = file.filename.rsplit(".", 1)[1].lower()
-    if ext not in ("jpg", "jpeg", "png"):
+    if ext not in PHOTO_EXTS:
         return jsonify({"success": False, "error": "Only JPG/PNG allowed"}), 400
 
-    # Remove old menu.* files
-    for old_ext in ("jpg", "jpeg", "png"):
-        old_path = os.path.join(app.config["UPLOAD_FOLDER"], f"menu.{old_ext}")
-        if os.path.exists(old_path):
-            try:
-                os.remove(old_path)
-            except Exception:
-                pass
+    data = read_image_upload(file)
+    if data is None:
+        return jsonify({"success": False, "error": "Not a valid image"}), 400
 
-    filename = f"menu.{ext}"
-    save_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    file.save(save_path)
+    # Re-encoded in the background; replaces any old menu photo files
+    submit_photo(MENU_PHOTOS, "menu", data)
 
-    url = f"/static/{filename}"
-    return jsonify({"success": True, "url": url})
+    return jsonify({"success": True, "pending": True, "url": None})
 
 
 @app.route("/api/menu-photo")
+@cached_response("menu_photo")
 def get_menu_photo():
     """
     Returns current menu photo URL for student app.
     """
-    for ext in ("jpg", "jpeg", "png"):
-        path = os.path.join(app.config["UPLOAD_FOLDER"], f"menu.{ext}")
-        if os.path.exists(path):
-            return jsonify({"photo": f"/static/menu.{ext}"})
-
-    return jsonify({"photo": None})
+    return jsonify({"photo": MENU_PHOTOS.get("menu")})
 
 
 # ============================================================
 #  MEMBER APIs (include photo upload support for POST)
 # ============================================================
 @app.route("/api/members", methods=["GET", "POST"])
+@cached_response("members", "member_photos")
 def members():
     if request.method == "GET":
         c = db()
-        cur = c.cursor(dictionary=True)
-        cur.execute("SELECT * FROM members")
-        rows = cur.fetchall()
-        cur.close()
-        c.close()
-
+        cur = c.cursor()
+        cur.execute("SELECT id, name, roll_or_id, allowed_slots FROM members")
         # Attach photo URL for each member
-        for r in rows:
-            r["photo"] = get_member_photo_url(r["id"])
-        return jsonify(rows)
+        rows = [MemberRow(*r, photo=get_member_photo_url(r[0])) for r in cur.fetchall()]
+        cur.close()
+        return json_list(rows)
 
     # ---------- POST (Add member) ----------
     # We support FormData (with optional photo) from admin.html
@@ -322,7 +1732,8 @@ def members():
         member_id = cur.lastrowid
         c.commit()
         cur.close()
-        c.close()
+        ROLLS.put(roll, member_id, name)
+        RESPONSES.bump("members")
 
         # Save photo if provided
         if "photo" in files:
@@ -330,18 +1741,11 @@ def members():
             if file and file.filename:
                 if "." in file.filename:
                     ext = file.filename.rsplit(".", 1)[1].lower()
-                    if ext in ("jpg", "jpeg", "png"):
-                        # remove old files for this member
-                        for old_ext in ("jpg", "jpeg", "png"):
-                            old_path = os.path.join(MEMBERS_FOLDER, f"{member_id}.{old_ext}")
-                            if os.path.exists(old_path):
-                                try:
-                                    os.remove(old_path)
-                                except Exception:
-                                    pass
-                        filename = f"{member_id}.{ext}"
-                        save_path = os.path.join(MEMBERS_FOLDER, filename)
-                        file.save(save_path)
+                    if ext in PHOTO_EXTS:
+                        data = read_image_upload(file)
+                        if data is not None:
+                            # re-encoded in the background; replaces old files
+                            submit_photo(MEMBER_PHOTOS, member_id, data)
 
         return jsonify({"status": "saved", "member_id": member_id})
 
@@ -364,8 +1768,9 @@ def members():
         (name, roll, slots, days_in_month),
     )
     c.commit()
+    ROLLS.put(roll, cur.lastrowid, name)
     cur.close()
-    c.close()
+    RESPONSES.bump("members")
 
     return jsonify({"status": "saved"})
 
@@ -377,41 +1782,425 @@ def delete_member(mid):
     cur.execute("DELETE FROM members WHERE id=%s", (mid,))
     c.commit()
     cur.close()
-    c.close()
+    MESS_STATUS.invalidate(mid)
+    ROLLS.remove(mid)
+    RESPONSES.bump("members")
 
     # Also delete photo if exists
-    for ext in ("jpg", "jpeg", "png"):
-        path = os.path.join(MEMBERS_FOLDER, f"{mid}.{ext}")
-        if os.path.exists(path):
-            try:
-                os.remove(path)
-            except Exception:
-                pass
+    MEMBER_PHOTOS.remove(mid)
 
     return jsonify({"status": "deleted"})
 
 
 # ============================================================
-#  SLOT-BASED QR TOKENS (ONE QR PER SLOT, COMMON FOR ALL)
+#  BULK MEMBER IMPORT  POST /api/members/import
+#  multipart: csv=<file> (columns name, roll_or_id, allowed_slots),
+#             photos=<zip> (optional, files named <roll_or_id>.jpg/png)
+#  - rows validated first (incl. column widths); existing rolls
+#    read in one query
+#  - new rolls inserted, known rolls get name/slots updated, in
+#    batched executemany transactions (counters are not touched);
+#    a batch the DB rejects is retried row by row so only the bad
+#    rows are reported as errors
+#  - photos go through the same pipeline as single uploads
+#  ?dry_run=1 → validate and report only
 # ============================================================
-def create_slot_token(slot: str) -> str:
-    """Create a global QR token for the given slot (not per member)."""
-    token = secrets.token_urlsafe(16)
+MEMBER_IMPORT_BATCH = 500
+MEMBER_IMPORT_MAX_BYTES = int(os.getenv("MEMBER_IMPORT_MAX_BYTES", str(200 * 1024 * 1024)))
+MEMBER_PHOTO_MAX_BYTES = 15 * 1024 * 1024     # per photo, same as a single upload
+MEMBER_NAME_MAX, MEMBER_ROLL_MAX = 100, 50     # members.name / roll_or_id widths
+# Corrupt (CRC, truncated, bad deflate data), encrypted or oddly
+# compressed ZIP entries
+ZIP_READ_ERRORS = (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError, EOFError, zlib.error)
+
+
+def roll_key(roll):
+    """Rolls compare case-insensitively, like the members table's collation."""
+    return roll.casefold()
+
+
+def parse_member_rows(stream):
+    """Yields (row_no, roll, name, slots, error) from the CSV."""
+    reader = csv.DictReader(TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    seen = set()
+    for row_no, row in enumerate(reader, start=2):      # row 1 is the header
+        name = (row.get("name") or "").strip()
+        roll = (row.get("roll_or_id") or "").strip()
+        slots = [s for s in re.split(r"[\s,;|]+", (row.get("allowed_slots") or "").lower()) if s]
+
+        error = None
+        if not name or not roll or not slots:
+            error = "Missing fields"
+        elif any(s not in SLOTS for s in slots):
+            error = "Unknown slot: " + ", ".join(s for s in slots if s not in SLOTS)
+        elif len(name) > MEMBER_NAME_MAX:
+            error = f"name longer than {MEMBER_NAME_MAX} characters"
+        elif len(roll) > MEMBER_ROLL_MAX:
+            error = f"roll_or_id longer than {MEMBER_ROLL_MAX} characters"
+        elif roll_key(roll) in seen:
+            error = "Duplicate roll_or_id in file"
+        else:
+            seen.add(roll_key(roll))
+        yield row_no, roll, name, ",".join(dict.fromkeys(slots)), error
+
+
+def index_photo_zip(zf):
+    """roll_key(roll_or_id) → ZipInfo for image files in the archive (folders ignored)."""
+    photos = {}
+    for info in zf.infolist():
+        if info.is_dir() or info.filename.startswith("__MACOSX/"):
+            continue
+        stem, dot, ext = os.path.basename(info.filename).rpartition(".")
+        if dot and stem and ext.lower() in PHOTO_EXTS:
+            photos[roll_key(stem)] = info
+    return photos
+
+
+def write_member_batches(c, cur, sql, rows, entries):
+    """
+    executemany in MEMBER_IMPORT_BATCH transactions. A batch the DB
+    rejects is rolled back and redone one row at a time; rows that
+    still fail get their report entry marked. Returns rows written.
+    """
+    written = 0
+    for i in range(0, len(rows), MEMBER_IMPORT_BATCH):
+        batch = rows[i:i + MEMBER_IMPORT_BATCH]
+        try:
+            cur.executemany(sql, batch)
+            c.commit()
+            written += len(batch)
+            continue
+        except mysql.connector.Error:
+            c.rollback()
+        for row, entry in zip(batch, entries[i:i + MEMBER_IMPORT_BATCH]):
+            try:
+                cur.execute(sql, row)
+                c.commit()
+                written += 1
+            except mysql.connector.Error as e:
+                c.rollback()
+                entry.update(status="error", error=f"Database error: {e.msg}")
+    return written
+
+
+@app.route("/api/members/import", methods=["POST"])
+def import_members():
+    dry_run = request.args.get("dry_run", "").lower() in ("1", "true", "yes")
+    request.max_content_length = MEMBER_IMPORT_MAX_BYTES
+
+    t0 = time.perf_counter()
+    csv_file = request.files.get("csv")
+    if not csv_file or not csv_file.filename:
+        return jsonify({"success": False, "error": "csv file is required"}), 400
+
+    zf = None
+    photos = {}
+    zip_file = request.files.get("photos")
+    if zip_file and zip_file.filename:
+        try:
+            zf = zipfile.ZipFile(zip_file.stream)
+        except zipfile.BadZipFile:
+            return jsonify({"success": False, "error": "photos must be a ZIP archive"}), 400
+        photos = index_photo_zip(zf)
+
+    try:
+        parsed = list(parse_member_rows(csv_file.stream))
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"success": False, "error": f"Unreadable CSV: {e}"}), 400
+    t_parse = time.perf_counter()
+
     c = db()
     cur = c.cursor()
-    # member_id = NULL → slot-level QR
+    cur.execute("SELECT id, roll_or_id FROM members")
+    existing = {roll_key(roll): mid for mid, roll in cur.fetchall()}
+
+    today = date.today()
+    days_in_month = get_days_in_month(today.year, today.month)
+
+    report, inserts, updates = [], [], []
+    insert_entries, update_entries = [], []
+    for row_no, roll, name, slots, error in parsed:
+        entry = {"row": row_no, "roll_or_id": roll}
+        if error:
+            entry.update(status="error", error=error)
+        elif roll_key(roll) in existing:
+            entry["status"] = "updated"
+            updates.append((name, slots, existing[roll_key(roll)]))
+            update_entries.append(entry)
+        else:
+            entry["status"] = "inserted"
+            inserts.append((name, roll, slots, days_in_month))
+            insert_entries.append(entry)
+        report.append(entry)
+
+    inserted, updated = 0, 0
+    if not dry_run:
+        inserted = write_member_batches(
+            c, cur,
+            """
+            INSERT INTO members(name,roll_or_id,allowed_slots,used_days,remaining,carry_forward)
+            VALUES(%s,%s,%s,0,%s,0)
+            """,
+            inserts, insert_entries,
+        )
+        updated = write_member_batches(
+            c, cur,
+            "UPDATE members SET name=%s, allowed_slots=%s WHERE id=%s",
+            updates, update_entries,
+        )
+        if inserted:
+            cur.execute("SELECT id, roll_or_id FROM members")
+            existing = {roll_key(roll): mid for mid, roll in cur.fetchall()}
+        ROLLS.invalidate()
+        RESPONSES.bump("members")
+    cur.close()
+    t_db = time.perf_counter()
+
+    photos_queued = 0
+    for entry in report:
+        key = roll_key(entry["roll_or_id"])
+        info = photos.get(key)
+        if info is None or entry["status"] == "error":
+            continue
+        if info.file_size > MEMBER_PHOTO_MAX_BYTES:
+            entry["photo"] = "too large"
+            continue
+        try:
+            with zf.open(info) as f:
+                raw = f.read()
+        except ZIP_READ_ERRORS:
+            entry["photo"] = "unreadable"
+            continue
+        data = read_image_upload(BytesIO(raw))
+        if data is None:
+            entry["photo"] = "not an image"
+            continue
+        if dry_run:
+            entry["photo"] = "ok"
+            continue
+        # re-encoded in the background; replaces old files
+        submit_photo(MEMBER_PHOTOS, existing[key], data)
+        entry["photo"] = "queued"
+        photos_queued += 1
+    matched = {roll_key(e["roll_or_id"]) for e in report if "photo" in e}
+    t_done = time.perf_counter()
+
+    return jsonify({
+        "success": True,
+        "dry_run": dry_run,
+        "rows": report,
+        "inserted": inserted,
+        "updated": updated,
+        "errors": sum(1 for e in report if e["status"] == "error"),
+        "photos_queued": photos_queued,
+        "photos_unmatched": len(set(photos) - matched),
+        "parse_ms": round((t_parse - t0) * 1000, 1),
+        "db_ms": round((t_db - t_parse) * 1000, 1),
+        "photos_ms": round((t_done - t_db) * 1000, 1),
+        "total_ms": round((t_done - t0) * 1000, 1),
+    })
+
+
+# ============================================================
+#  SLOT TOKEN CACHE
+#  One global token per (slot, date). Entries are keyed by
+#  (slot, date) and only the current key is ever looked up, so an
+#  entry is dropped on the first access after the slot boundary.
+# ============================================================
+class SlotTokenCache:
+    """
+    Lives in the shared cache (see CACHE_BACKEND) so every worker sees
+    the same token and a rotation invalidates it everywhere. Hit/miss
+    counters are per process.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def _key(slot, day):
+        return f"slot_token:{slot}:{day.isoformat()}"
+
+    def get(self, slot, day):
+        token = self.cache.get(self._key(slot, day))
+        self._counters["hits" if token else "misses"] += 1
+        return token
+
+    def put(self, slot, day, token, at=None):
+        # Expires exactly at the end of the slot (per the schedule).
+        # `at` caches the upcoming slot's token ahead of its start.
+        now = datetime.now(IST)
+        current, seconds_left = current_slot_info(at or now)
+        if current != slot:
+            return
+        if at is not None:
+            seconds_left += (at - now).total_seconds()
+        self.cache.set(self._key(slot, day), token, ttl=seconds_left)
+
+    def invalidate(self, slot=None, day=None):
+        self._counters["invalidations"] += 1
+        day = day or date.today()
+        for s in ([slot] if slot else SLOTS):
+            self.cache.delete(self._key(s, day))
+
+    def stats(self):
+        return {"backend": self.cache.name, **self._counters}
+
+
+SLOT_TOKENS = SlotTokenCache(CACHE)
+register_stats("slot_tokens", SLOT_TOKENS.stats)
+
+
+def fetch_slot_token(slot, day):
+    """Slot-level token straight from qr_tokens, or None."""
+    cur = db().cursor(dictionary=True)
     cur.execute(
         """
-        INSERT INTO qr_tokens(member_id, token, slot, valid_date)
-        VALUES(%s,%s,%s,%s)
+        SELECT token FROM qr_tokens
+        WHERE member_id IS NULL AND slot=%s AND valid_date=%s
+        LIMIT 1
         """,
-        (None, token, slot, date.today()),
+        (slot, day),
     )
-    c.commit()
+    row = cur.fetchone()
     cur.close()
-    c.close()
+    return row["token"] if row else None
+
+
+def get_slot_token(slot, day=None):
+    """Current slot-level token: cache first, DB on miss. None if not created yet."""
+    day = day or date.today()
+    token = SLOT_TOKENS.get(slot, day)
+    if token:
+        return token
+
+    token = fetch_slot_token(slot, day)
+    if token:
+        SLOT_TOKENS.put(slot, day, token)
     return token
 
+
+# ============================================================
+#  RENDERED QR CACHE
+#  PNG + data URL per token. A slot token only changes once per
+#  slot, so the 60 s kiosk polls reuse the same render.
+# ============================================================
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", "32"))
+
+
+def qr_url(token):
+    return FRONTEND_URL + "/?token=" + token
+
+
+def render_qr_png(token):
+    with span("qr_render"):
+        return qr_render.render_png(qr_url(token))
+
+
+class QrImageCache:
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()   # token -> {"png", "data_url", "etag"}
+        self._counters = {"hits": 0, "misses": 0, "render_ms_total": 0.0, "last_render_ms": 0.0}
+
+    def get(self, token):
+        with self._lock:
+            entry = self._items.get(token)
+            if entry:
+                self._items.move_to_end(token)
+                self._counters["hits"] += 1
+                return entry
+            self._counters["misses"] += 1
+
+        # Render outside the lock – two racing misses just render twice
+        t0 = time.perf_counter()
+        png = render_qr_png(token)
+        entry = {
+            "png": png,
+            "data_url": "data:image/png;base64," + base64.b64encode(png).decode(),
+            "etag": hashlib.sha1(png).hexdigest(),
+        }
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+
+        with self._lock:
+            self._counters["render_ms_total"] += elapsed_ms
+            self._counters["last_render_ms"] = elapsed_ms
+            self._items[token] = entry
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            c = self._counters
+            lookups = c["hits"] + c["misses"]
+            return {
+                "entries": len(self._items),
+                "hits": c["hits"],
+                "misses": c["misses"],
+                "hit_ratio": round(c["hits"] / lookups, 3) if lookups else None,
+                "avg_render_ms": round(c["render_ms_total"] / c["misses"], 2) if c["misses"] else None,
+                "last_render_ms": round(c["last_render_ms"], 2),
+            }
+
+
+QR_IMAGES = QrImageCache(QR_CACHE_SIZE)
+register_stats("qr_images", QR_IMAGES.stats)
+
+
+# ============================================================
+#  SLOT-BASED QR TOKENS (ONE QR PER SLOT, COMMON FOR ALL)
+# ============================================================
+SLOT_PREGEN_SECONDS = int(os.getenv("SLOT_PREGEN_SECONDS", "60"))
+
+
+def create_slot_token(slot: str, day=None, at=None) -> str:
+    """
+    Insert-or-fetch the global QR token for the given slot (not per member).
+    uq_qr_tokens_slot_day allows one slot-level row per (slot, date), so
+    racing workers and kiosks all end up with the token that won.
+    """
+    day = day or date.today()
+    c = db()
+    # End our read snapshot so the read-back sees the winner's commit
+    c.commit()
+    token = secrets.token_urlsafe(16)
+    cur = c.cursor()
+    # member_id = NULL → slot-level QR
+    cur.execute(
+        """
+        INSERT INTO qr_tokens(member_id, token, slot, valid_date)
+        VALUES(%s,%s,%s,%s)
+        ON DUPLICATE KEY UPDATE id = id
+        """,
+        (None, token, slot, day),
+    )
+    inserted = cur.rowcount == 1
+    c.commit()
+    cur.close()
+    if not inserted:
+        token = fetch_slot_token(slot, day)
+    SLOT_TOKENS.put(slot, day, token, at=at)
+    return token
+
+
+def prepare_next_slot(seconds_left):
+    """
+    Create, cache and render the upcoming slot's token before the
+    boundary, so the first poll after rollover is a cache hit.
+    """
+    at = datetime.now(IST) + timedelta(seconds=seconds_left + 1)
+    slot, _ = current_slot_info(at)
+    if slot is None:
+        return None
+    # valid_date follows the server date, like date.today() elsewhere
+    day = datetime.fromtimestamp(at.timestamp()).date()
+    token = create_slot_token(slot, day, at=at)
+    QR_IMAGES.get(token)
+    return slot
+
 FRONTEND_URL = os.getenv("FRONTEND_URL","https://cecmess.netlify.app")
 @app.route("/api/get-slot-qr")
 def get_slot_qr():
@@ -423,35 +2212,59 @@ def get_slot_qr():
       - return QR image as data URL
     """
     slot = get_current_slot()
+    if slot is None:
+        return jsonify({"qr": None, "slot": None})
+    token = get_slot_token(slot) or create_slot_token(slot)
+
+    qr = QR_IMAGES.get(token)
+    return jsonify({"qr": qr["data_url"], "slot": slot})
+
+
+@app.route("/api/slot-qr.png")
+def slot_qr_png():
+    """
+    Same QR as /api/get-slot-qr but as a binary PNG with an ETag.
+    Polling kiosks revalidate and get 304 until the token changes.
+    """
+    slot = get_current_slot()
+    if slot is None:
+        return jsonify({"success": False, "error": "No meal slot right now"}), 404
+    token = get_slot_token(slot) or create_slot_token(slot)
+    qr = QR_IMAGES.get(token)
+
+    resp = Response(qr["png"], mimetype="image/png")
+    resp.set_etag(qr["etag"])
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Slot"] = slot
+    return resp.make_conditional(request)
+
+
+@app.route("/api/rotate-slot-qr", methods=["POST"])
+def rotate_slot_qr():
+    """
+    Admin replaces the current slot QR (e.g. a photo of it leaked).
+    The old token stops validating immediately.
+    """
+    slot = get_current_slot()
+    if slot is None:
+        return jsonify({"success": False, "error": "No meal slot right now"}), 409
 
-    # Find existing slot-level token
     c = db()
-    cur = c.cursor(dictionary=True)
+    cur = c.cursor()
     cur.execute(
         """
-        SELECT token FROM qr_tokens
+        DELETE FROM qr_tokens
         WHERE member_id IS NULL AND slot=%s AND valid_date=%s
-        LIMIT 1
         """,
         (slot, date.today()),
     )
-    row = cur.fetchone()
+    c.commit()
     cur.close()
-    c.close()
 
-    if row:
-        token = row["token"]
-    else:
-        token = create_slot_token(slot)
-
-    # Build QR image
-    url = FRONTEND_URL + "/?token=" + token
-    img = qrcode.make(url)
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    qr_data = "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
-
-    return jsonify({"qr": qr_data, "slot": slot})
+    SLOT_TOKENS.invalidate(slot)
+    create_slot_token(slot)
+    publish_slot_qr()
+    return jsonify({"status": "rotated", "slot": slot})
 
 
 # ============================================================
@@ -470,7 +2283,6 @@ def create_token(member_id, slot):
     )
     c.commit()
     cur.close()
-    c.close()
     return token
 
 
@@ -481,7 +2293,6 @@ def generate_qr(mid):
     cur.execute("SELECT allowed_slots FROM members WHERE id=%s", (mid,))
     m = cur.fetchone()
     cur.close()
-    c.close()
 
     if not m:
         return jsonify([])
@@ -491,13 +2302,8 @@ def generate_qr(mid):
 
     for s in slots:
         t = create_token(mid, s)
-        url = FRONTEND_URL + "/?token=" + t
-
-        img = qrcode.make(url)
-        buf = BytesIO()
-        img.save(buf, format="PNG")
         qr_data = (
-            "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
+            "data:image/png;base64," + base64.b64encode(render_qr_png(t)).decode()
         )
 
         qr_list.append({"slot": s, "qr_data": qr_data})
@@ -505,146 +2311,704 @@ def generate_qr(mid):
     return jsonify(qr_list)
 
 
-@app.route("/api/generate_all")
-def generate_all():
+TOKEN_INSERT_BATCH = 1000
+
+
+def generate_member_tokens(day, dry_run=False, ids=None):
+    """
+    Bulk version of create_token for the whole roster (or just `ids`):
+      - one query for members, one for today's existing member tokens
+      - missing (member, slot) pairs worked out in memory
+      - inserted with batched executemany in a single transaction
+    Returns counts + timings.
+    """
+    t0 = time.perf_counter()
     c = db()
-    cur = c.cursor(dictionary=True)
-    cur.execute("SELECT * FROM members")
+    cur = c.cursor()
+
+    id_filter, id_params = "", []
+    if ids:
+        id_filter = " IN (" + ",".join(["%s"] * len(ids)) + ")"
+        id_params = list(ids)
+
+    sql = "SELECT id, allowed_slots FROM members"
+    if ids:
+        sql += " WHERE id" + id_filter
+    cur.execute(sql, id_params)
     members = cur.fetchall()
-    cur.close()
-    c.close()
-
-    count = 0
-    for m in members:
-        slots = [x.strip() for x in m["allowed_slots"].split(",") if x.strip()]
-        for s in slots:
-            c2 = db()
-            cur2 = c2.cursor()
-            cur2.execute(
+
+    sql = """
+        SELECT member_id, slot FROM qr_tokens
+        WHERE valid_date=%s AND member_id IS NOT NULL
+    """
+    if ids:
+        sql += " AND member_id" + id_filter
+    cur.execute(sql, [day] + id_params)
+    existing = set(cur.fetchall())
+    t_read = time.perf_counter()
+
+    missing = []
+    for mid, allowed_slots in members:
+        for s in allowed_slots.split(","):
+            s = s.strip()
+            if s and (mid, s) not in existing:
+                missing.append((mid, s))
+
+    if not dry_run and missing:
+        rows = [(mid, secrets.token_urlsafe(16), s, day) for mid, s in missing]
+        for i in range(0, len(rows), TOKEN_INSERT_BATCH):
+            cur.executemany(
                 """
-                SELECT id FROM qr_tokens
-                WHERE member_id=%s AND slot=%s AND valid_date=%s
+                INSERT INTO qr_tokens(member_id,token,slot,valid_date)
+                VALUES(%s,%s,%s,%s)
                 """,
-                (m["id"], s, date.today()),
+                rows[i:i + TOKEN_INSERT_BATCH],
             )
-            exists = cur2.fetchone()
-            cur2.close()
-            c2.close()
+        c.commit()
+    cur.close()
+    t_done = time.perf_counter()
+
+    return {
+        "members": len(members),
+        "existing": len(existing),
+        "missing": len(missing),
+        "created": 0 if dry_run else len(missing),
+        "dry_run": dry_run,
+        "read_ms": round((t_read - t0) * 1000, 1),
+        "insert_ms": round((t_done - t_read) * 1000, 1),
+        "total_ms": round((t_done - t0) * 1000, 1),
+    }
 
-            if not exists:
-                create_token(m["id"], s)
-                count += 1
 
-    return jsonify({"message": f"Generated {count} QR tokens"})
+@app.route("/api/generate_all")
+def generate_all():
+    """
+    Make sure every member has a token for each allowed slot today.
+    ?dry_run=1 → only report how many would be created.
+    """
+    dry_run = request.args.get("dry_run", "").lower() in ("1", "true", "yes")
+    result = generate_member_tokens(date.today(), dry_run=dry_run)
+
+    if dry_run:
+        result["message"] = f"Would generate {result['missing']} QR tokens"
+    else:
+        result["message"] = f"Generated {result['created']} QR tokens"
+    return jsonify(result)
+
+
+# ============================================================
+#  BATCH MEMBER QR EXPORT  (ZIP of PNGs / printable PDF sheets)
+#  POST /api/qr-export              → starts a job, returns job id
+#  GET  /api/qr-export/<id>         → progress
+#  GET  /api/qr-export/<id>/download
+#  Rendering is CPU-bound, so it runs in a process pool fed by a
+#  background thread; the web worker only answers the quick calls.
+#  Job state lives in the shared cache so any worker can answer.
+# ============================================================
+QR_EXPORT_DIR = os.getenv("QR_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "canteen-qr-exports"))
+QR_RENDER_PROCESSES = int(os.getenv("QR_RENDER_PROCESSES", str(os.cpu_count() or 2)))
+QR_EXPORT_TTL = 6 * 3600      # seconds job status and files are kept
+QR_SHEET_COLS, QR_SHEET_ROWS = 3, 4
+QR_SHEET_SIZE = (1240, 1754)  # A4 at 150 dpi
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # forkserver, not fork: forking this multi-threaded worker
+            # could copy a lock some other thread holds. Children come
+            # from a clean server that preloads only qr_render.
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload(["qr_render"])
+            _render_pool = ProcessPoolExecutor(max_workers=QR_RENDER_PROCESSES, mp_context=ctx)
+        return _render_pool
+
+
+def _save_job(job):
+    CACHE.set(f"qr_export:{job['id']}", {k: v for k, v in job.items() if not k.startswith("_")}, ttl=QR_EXPORT_TTL)
+
+
+def _load_job(job_id):
+    return CACHE.get(f"qr_export:{job_id}")
+
+
+def _tick(job):
+    job["done"] += 1
+    if job["done"] % 100 == 0:
+        _save_job(job)
+
+
+def _write_qr_zip(path, rows, pngs, job):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:   # PNG is already compressed
+        for (mid, name, roll, slot, _token), png in zip(rows, pngs):
+            zf.writestr(f"{roll}_{slot}.png", png)
+            _tick(job)
+
+
+def _write_qr_pdf(path, rows, pngs, job):
+    """One A4 page per QR_SHEET_COLS x QR_SHEET_ROWS QRs, appended page by page."""
+    per_page = QR_SHEET_COLS * QR_SHEET_ROWS
+    cell_w = QR_SHEET_SIZE[0] // QR_SHEET_COLS
+    cell_h = QR_SHEET_SIZE[1] // QR_SHEET_ROWS
+    qr_side = min(cell_w, cell_h - 40) - 20
+
+    page, draw, first = None, None, True
+    for i, ((mid, name, roll, slot, _token), png) in enumerate(zip(rows, pngs)):
+        if i % per_page == 0:
+            if page is not None:
+                page.save(path, "PDF", resolution=150, append=not first)
+                first = False
+            page = Image.new("L", QR_SHEET_SIZE, 255)
+            draw = ImageDraw.Draw(page)
+
+        col = (i % per_page) % QR_SHEET_COLS
+        row = (i % per_page) // QR_SHEET_COLS
+        x, y = col * cell_w, row * cell_h
+        qr_img = Image.open(BytesIO(png)).convert("L").resize((qr_side, qr_side))
+        page.paste(qr_img, (x + (cell_w - qr_side) // 2, y + 10))
+        draw.text((x + 20, y + qr_side + 14), f"{name} ({roll}) - {slot}", fill=0)
+        _tick(job)
+
+    if page is not None:
+        page.save(path, "PDF", resolution=150, append=not first)
+
+
+def _run_qr_export(job, rows):
+    try:
+        urls = [qr_url(r[4]) for r in rows]
+        pngs = get_render_pool().map(qr_render.render_png, urls, chunksize=32)
+        if job["format"] == "pdf":
+            _write_qr_pdf(job["path"], rows, pngs, job)
+        else:
+            _write_qr_zip(job["path"], rows, pngs, job)
+        job["status"] = "done"
+    except Exception as e:
+        app.logger.exception("QR export %s failed", job["id"])
+        job["status"] = "failed"
+        job["error"] = str(e)
+    job["elapsed_ms"] = round((time.perf_counter() - job["_t0"]) * 1000, 1)
+    _save_job(job)
+
+
+def _prune_qr_exports():
+    """Delete export files older than QR_EXPORT_TTL."""
+    cutoff = time.time() - QR_EXPORT_TTL
+    with os.scandir(QR_EXPORT_DIR) as it:
+        for entry in it:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _public_job(job):
+    return {k: v for k, v in job.items() if not k.startswith("_") and k != "path"}
+
+
+@app.route("/api/qr-export", methods=["POST"])
+def start_qr_export():
+    """
+    Query args: format=zip|pdf (default zip), ids=1,2,3 (default: everyone).
+    Tokens missing for today are created first, in bulk.
+    """
+    fmt = request.args.get("format", "zip").lower()
+    if fmt not in ("zip", "pdf"):
+        return jsonify({"success": False, "error": "format must be zip or pdf"}), 400
+    ids = [int(x) for x in request.args.get("ids", "").split(",") if x.strip().isdigit()]
+
+    day = date.today()
+    generate_member_tokens(day, ids=ids)
+
+    sql = """
+        SELECT q.member_id, m.name, m.roll_or_id, q.slot, q.token
+        FROM qr_tokens q
+        JOIN members m ON m.id = q.member_id
+        WHERE q.valid_date = %s
+    """
+    params = [day]
+    if ids:
+        sql += " AND q.member_id IN (" + ",".join(["%s"] * len(ids)) + ")"
+        params += ids
+    sql += " ORDER BY m.name, q.member_id, q.slot, q.id"
+
+    cur = db().cursor()
+    cur.execute(sql, params)
+    # /api/member/generate can leave several tokens per member & slot;
+    # keep only the newest one (dicts keep first-insertion order)
+    latest = {}
+    for r in cur.fetchall():
+        latest[(r[0], r[3])] = r
+    rows = list(latest.values())
+    cur.close()
+
+    os.makedirs(QR_EXPORT_DIR, exist_ok=True)
+    job_id = secrets.token_hex(8)
+    job = {
+        "id": job_id,
+        "format": fmt,
+        "status": "running",
+        "total": len(rows),
+        "done": 0,
+        "error": None,
+        "elapsed_ms": None,
+        "path": os.path.join(QR_EXPORT_DIR, f"member_qrs_{job_id}.{fmt}"),
+        "_t0": time.perf_counter(),
+    }
+    _save_job(job)
+    _prune_qr_exports()
+
+    threading.Thread(target=_run_qr_export, args=(job, rows), daemon=True).start()
+    return jsonify(_public_job(job)), 202
+
+
+@app.route("/api/qr-export/<job_id>")
+def qr_export_status(job_id):
+    job = _load_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Unknown export"}), 404
+    return jsonify(_public_job(job))
+
+
+@app.route("/api/qr-export/<job_id>/download")
+def qr_export_download(job_id):
+    job = _load_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Unknown export"}), 404
+    if job["status"] != "done":
+        return jsonify(_public_job(job)), 409
+    return send_file(
+        job["path"],
+        mimetype="application/pdf" if job["format"] == "pdf" else "application/zip",
+        as_attachment=True,
+        download_name=f"member_qrs_{date.today()}.{job['format']}",
+    )
 
 
 # ============================================================
 #  MESS DAY TRACKING
+#  Helpers take an open cursor and run inside the caller's
+#  transaction – nothing here commits.
+#  Relies on UNIQUE(member_id, date) on mess_days (see startup).
 # ============================================================
-def ensure_day_record(member_id):
-    c = db()
-    cur = c.cursor()
+def ensure_day_record(cur, member_id, day):
+    # Upsert also takes the row lock, so concurrent scans of the
+    # same member queue up behind each other here.
     cur.execute(
         """
-        SELECT id FROM mess_days WHERE member_id=%s AND date=%s
+        INSERT INTO mess_days(member_id,date) VALUES(%s,%s)
+        ON DUPLICATE KEY UPDATE member_id = member_id
         """,
-        (member_id, date.today()),
+        (member_id, day),
     )
-    row = cur.fetchone()
-    if not row:
-        cur.execute(
-            "INSERT INTO mess_days(member_id,date) VALUES(%s,%s)",
-            (member_id, date.today()),
-        )
-        c.commit()
-    cur.close()
-    c.close()
 
 
-def update_usage(member_id, slot):
+def update_usage(cur, member_id, slot, day):
     """
-    Mark slot used today. If this is first slot today,
-    increase used_days and decrease remaining.
+    Mark slot used for the day. Returns False if it was already used.
+    If this is first slot of the day, increase used_days and decrease
+    remaining (conditional on consumed=0, so a day is counted once).
     """
-    ensure_day_record(member_id)
+    if slot not in SLOTS:
+        raise ValueError(f"unknown slot {slot!r}")
 
-    # 1) Mark this slot as used = 1
-    c = db()
-    cur = c.cursor()
+    ensure_day_record(cur, member_id, day)
+
+    # 1) Mark this slot as used – no row changed means already scanned
     cur.execute(
         f"""
         UPDATE mess_days SET {slot}=1
-        WHERE member_id=%s AND date=%s
+        WHERE member_id=%s AND date=%s AND {slot}=0
         """,
-        (member_id, date.today()),
+        (member_id, day),
     )
-    c.commit()
-    cur.close()
-    c.close()
+    if cur.rowcount == 0:
+        return False
 
-    # 2) If day not counted yet, count one full mess day
-    c2 = db()
-    cur2 = c2.cursor(dictionary=True)
-    cur2.execute(
+    # 2) First slot of the day → count one full mess day
+    cur.execute(
         """
-        SELECT morning,afternoon,evening,night,consumed
-        FROM mess_days WHERE member_id=%s AND date=%s
+        UPDATE mess_days SET consumed=1
+        WHERE member_id=%s AND date=%s AND consumed=0
         """,
-        (member_id, date.today()),
+        (member_id, day),
     )
-    r = cur2.fetchone()
-    cur2.close()
-    c2.close()
-
-    if r and r["consumed"] == 0:
-        if r["morning"] or r["afternoon"] or r["evening"] or r["night"]:
-            # mark day consumed
-            c3 = db()
-            cur3 = c3.cursor()
-            cur3.execute(
-                """
-                UPDATE mess_days SET consumed=1
-                WHERE member_id=%s AND date=%s
-                """,
-                (member_id, date.today()),
-            )
-            c3.commit()
-            cur3.close()
-            c3.close()
-
-            # update member counters
-            c4 = db()
-            cur4 = c4.cursor()
-            cur4.execute(
-                """
-                UPDATE members
-                SET used_days = used_days + 1,
-                    remaining = remaining - 1
-                WHERE id=%s
-                """,
-                (member_id,),
-            )
-            c4.commit()
-            cur4.close()
-            c4.close()
+    if cur.rowcount == 1:
+        cur.execute(
+            """
+            UPDATE members
+            SET used_days = used_days + 1,
+                remaining = remaining - 1
+            WHERE id=%s
+            """,
+            (member_id,),
+        )
+    return True
 
 
 # ============================================================
-#  SCAN LOGGING
+#  USAGE COUNTERS
+#  mess_days is the source of truth; members.used_days/remaining
+#  are counters bumped by update_usage in the scan transaction.
+#  /api/mess-status reads through MESS_STATUS, which is dropped
+#  when the member scans, on delete and on month reset. A
+#  background reconciler recounts from mess_days, reports drift
+#  and fixes it.
 # ============================================================
-def save_scan(member_id, token, slot, success, message):
+MESS_STATUS_TTL = int(os.getenv("MESS_STATUS_TTL", "60"))
+USAGE_RECONCILE_SECONDS = int(os.getenv("USAGE_RECONCILE_SECONDS", "900"))
+USAGE_RECONCILE_LOCK = "canteen_usage_reconcile"
+
+
+class MessStatusCache:
+    """
+    Status row per member in the shared cache. Keys carry an epoch
+    so a month reset drops every entry with a single write.
+    """
+
+    def __init__(self, cache, ttl):
+        self.cache = cache
+        self.ttl = ttl
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _key(self, member_id):
+        epoch = self.cache.get("mess_status_epoch") or 0
+        return f"mess_status:{epoch}:{member_id}"
+
+    def get(self, member_id):
+        row = self.cache.get(self._key(member_id))
+        self._counters["hits" if row else "misses"] += 1
+        return row
+
+    def put(self, member_id, row):
+        self.cache.set(self._key(member_id), row, ttl=self.ttl)
+
+    def invalidate(self, member_id):
+        self._counters["invalidations"] += 1
+        self.cache.delete(self._key(member_id))
+
+    def invalidate_all(self):
+        self._counters["invalidations"] += 1
+        self.cache.set("mess_status_epoch", time.time_ns())
+
+    def stats(self):
+        return dict(self._counters)
+
+
+MESS_STATUS = MessStatusCache(CACHE, MESS_STATUS_TTL)
+register_stats("mess_status", MESS_STATUS.stats)
+
+_reconcile_stats = {"runs": 0, "last_run_at": None, "last_run_ms": None, "last_drifted": 0, "fixed_total": 0}
+register_stats("usage_reconcile", lambda: dict(_reconcile_stats))
+
+
+def reconcile_usage():
+    """
+    Recount used_days from mess_days (one aggregate query) and fix
+    members whose counter drifted. Each fix only applies if used_days
+    still holds the value we read, so a scan landing mid-pass is left
+    for the next pass. remaining moves by the same amount, keeping
+    paid days (used + remaining) unchanged. Returns the drift report.
+    """
+    t0 = time.perf_counter()
     c = db()
-    cur = c.cursor()
+    c.commit()    # fresh snapshot for the recount
+    cur = c.cursor(dictionary=True)
     cur.execute(
         """
-        INSERT INTO scans(member_id,token,slot,valid_date,success,message)
-        VALUES(%s,%s,%s,%s,%s,%s)
-        """,
-        (member_id, token, slot, date.today(), int(success), message),
+        SELECT m.id, m.used_days, COALESCE(SUM(d.consumed), 0) AS counted
+        FROM members m
+        LEFT JOIN mess_days d ON d.member_id = m.id
+        GROUP BY m.id, m.used_days
+        HAVING m.used_days <> counted
+        """
     )
+    drift = [
+        {"member_id": r["id"], "used_days": r["used_days"], "counted": int(r["counted"])}
+        for r in cur.fetchall()
+    ]
+
+    fixed = []
+    for d in drift:
+        cur.execute(
+            """
+            UPDATE members
+            SET used_days = %s,
+                remaining = remaining + %s
+            WHERE id=%s AND used_days=%s
+            """,
+            (d["counted"], d["used_days"] - d["counted"], d["member_id"], d["used_days"]),
+        )
+        if cur.rowcount == 1:
+            fixed.append(d["member_id"])
     c.commit()
     cur.close()
-    c.close()
+
+    for mid in fixed:
+        MESS_STATUS.invalidate(mid)
+    if fixed:
+        RESPONSES.bump("usage")
+
+    elapsed_ms = round((time.perf_counter() - t0) * 1000, 1)
+    _reconcile_stats["runs"] += 1
+    _reconcile_stats["last_run_at"] = datetime.now(IST).strftime("%Y-%m-%d %H:%M:%S")
+    _reconcile_stats["last_run_ms"] = elapsed_ms
+    _reconcile_stats["last_drifted"] = len(drift)
+    _reconcile_stats["fixed_total"] += len(fixed)
+    return {"drifted": drift, "fixed": len(fixed), "elapsed_ms": elapsed_ms}
+
+
+def _usage_reconcile_loop():
+    while True:
+        time.sleep(USAGE_RECONCILE_SECONDS)
+        try:
+            with app.app_context():
+                # One worker per pass is enough
+                with advisory_lock(USAGE_RECONCILE_LOCK, 0) as got:
+                    if not got:
+                        continue
+                    report = reconcile_usage()
+            if report["drifted"]:
+                app.logger.warning(
+                    "Usage drift on %d member(s), fixed %d: %s",
+                    len(report["drifted"]), report["fixed"], report["drifted"][:20],
+                )
+        except Exception:
+            app.logger.exception("Usage reconcile failed")
+
+
+@app.route("/api/reconcile-usage", methods=["POST"])
+def reconcile_usage_api():
+    with advisory_lock(USAGE_RECONCILE_LOCK, 0) as got:
+        if not got:
+            return jsonify({"status": "busy", "message": "Reconcile already running"}), 409
+        report = reconcile_usage()
+    return jsonify(report)
+
+
+# ============================================================
+#  SCAN LOGGING (write-behind)
+#  save_scan() only queues the row. A background thread writes the
+#  queue in multi-row INSERTs when SCAN_LOG_BATCH rows are waiting
+#  or SCAN_LOG_FLUSH_SECONDS have passed. If the DB is down (or the
+#  queue is full) rows go to an append-only JSON-lines spill file,
+#  which is replayed after the next successful flush.
+#  Every worker shares the spill file, so appends, rotation and
+#  replay take flock()s on <spill>.lock / <spill>.replay.lock.
+# ============================================================
+SCAN_LOG_QUEUE_SIZE = int(os.getenv("SCAN_LOG_QUEUE_SIZE", "10000"))
+SCAN_LOG_BATCH = int(os.getenv("SCAN_LOG_BATCH", "200"))
+SCAN_LOG_FLUSH_SECONDS = float(os.getenv("SCAN_LOG_FLUSH_SECONDS", "1.0"))
+SCAN_LOG_SPILL_PATH = os.getenv("SCAN_LOG_SPILL_PATH", "scan_log_spill.jsonl")
+
+
+class ScanLogWriter:
+    INSERT_SQL = """
+        INSERT INTO scans(member_id,token,slot,valid_date,success,message,scanned_at)
+        VALUES(%s,%s,%s,%s,%s,%s,%s)
+    """
+
+    def __init__(self, maxsize, batch, interval, spill_path):
+        self.batch = batch
+        self.interval = interval
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_locks = {".lock": threading.Lock(), ".replay.lock": threading.Lock()}
+        self._counters = {
+            "queued": 0,
+            "written": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "flushes": 0,
+            "flush_ms_total": 0.0,
+            "last_flush_ms": 0.0,
+        }
+
+    # ---- producer side ----
+    def log(self, row):
+        if self._thread is None or not self._thread.is_alive():
+            # No writer (scripts, shutdown): write straight through
+            self._flush([row])
+            return
+        try:
+            self._queue.put_nowait(row)
+            self._counters["queued"] += 1
+        except queue.Full:
+            self._spill([row])
+
+    # ---- writer thread ----
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="scan-log", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Drain the queue and stop (called at interpreter exit)."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _take_batch(self):
+        rows = []
+        deadline = time.monotonic() + self.interval
+        while len(rows) < self.batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while not self._stop.is_set():
+            rows = self._take_batch()
+            if rows:
+                self._flush(rows)
+        # Shutdown: write whatever is left
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for i in range(0, len(rows), self.batch):
+            self._flush(rows[i:i + self.batch])
+
+    def _insert(self, rows):
+        with POOL.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(self.INSERT_SQL, rows)
+            conn.commit()
+            cur.close()
+
+    def _flush(self, rows):
+        t0 = time.perf_counter()
+        try:
+            self._insert(rows)
+        except (mysql.connector.Error, PoolTimeout) as e:
+            app.logger.warning("Scan log flush failed (%s), spilling %d rows", e, len(rows))
+            self._spill(rows)
+            return
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        c = self._counters
+        c["written"] += len(rows)
+        c["flushes"] += 1
+        c["flush_ms_total"] += elapsed_ms
+        c["last_flush_ms"] = elapsed_ms
+        self._replay_spill()
+
+    # ---- spill file ----
+    @contextmanager
+    def _locked(self, suffix, wait=True):
+        """
+        Exclusive lock on <spill_path><suffix>, across threads and
+        worker processes. Yields False if wait=False and it is taken.
+        """
+        if fcntl is None:           # no flock (Windows): one process, thread lock only
+            lock = self._thread_locks[suffix]
+            got = lock.acquire(wait)
+            try:
+                yield got
+            finally:
+                if got:
+                    lock.release()
+            return
+        with open(self.spill_path + suffix, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _spill(self, rows):
+        with self._locked(".lock"):
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for r in rows:
+                    f.write(json.dumps(r, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self._counters["spilled"] += len(rows)
+
+    def _replay_spill(self):
+        replay_path = self.spill_path + ".replay"
+        if not (os.path.exists(self.spill_path) or os.path.exists(replay_path)):
+            return
+        with self._locked(".replay.lock", wait=False) as got:
+            if not got:
+                return              # another worker is replaying
+            while True:
+                # A .replay left by a failed pass goes first
+                if not os.path.exists(replay_path):
+                    with self._locked(".lock"):
+                        if not os.path.exists(self.spill_path):
+                            return
+                        os.replace(self.spill_path, replay_path)
+                if not self._replay_file(replay_path):
+                    return
+
+    def _replay_file(self, path):
+        """Inserts the rows in `path`; on failure it keeps only the rows not yet inserted."""
+        with open(path, encoding="utf-8") as f:
+            rows = [tuple(json.loads(line)) for line in f if line.strip()]
+        done = 0
+        try:
+            for i in range(0, len(rows), self.batch):
+                batch = rows[i:i + self.batch]
+                self._insert(batch)
+                done += len(batch)
+        except (mysql.connector.Error, PoolTimeout) as e:
+            app.logger.warning("Scan log replay failed (%s); %d rows kept in %s", e, len(rows) - done, path)
+            if done:
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for r in rows[done:]:
+                        f.write(json.dumps(r, default=str) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+                self._counters["replayed"] += done
+            return False
+        os.remove(path)
+        self._counters["replayed"] += len(rows)
+        return True
+
+    def stats(self):
+        c = self._counters
+        return {
+            "depth": self._queue.qsize(),
+            "running": bool(self._thread and self._thread.is_alive()),
+            "queued": c["queued"],
+            "written": c["written"],
+            "spilled": c["spilled"],
+            "replayed": c["replayed"],
+            "flushes": c["flushes"],
+            "avg_flush_ms": round(c["flush_ms_total"] / c["flushes"], 2) if c["flushes"] else None,
+            "last_flush_ms": round(c["last_flush_ms"], 2),
+        }
+
+
+SCAN_LOG = ScanLogWriter(SCAN_LOG_QUEUE_SIZE, SCAN_LOG_BATCH, SCAN_LOG_FLUSH_SECONDS, SCAN_LOG_SPILL_PATH)
+register_stats("scan_log", SCAN_LOG.stats)
+atexit.register(SCAN_LOG.stop)
+
+
+def save_scan(member_id, token, slot, success, message, day=None):
+    """Queues the log row; returns its scanned_at (taken now, not when the row is flushed)."""
+    scanned_at = datetime.now()
+    SCAN_LOG.log((member_id, token, slot, day or date.today(), int(success), message, scanned_at))
+    return scanned_at
 
 
 # ============================================================
@@ -653,7 +3017,12 @@ def save_scan(member_id, token, slot, success, message):
 #  - carry_forward = 0
 #  - remaining = days_in_current_month
 #  - mess_days cleared
+#  - app_meta.last_reset = today (same commit)
 # ============================================================
+MONTH_RESET_LOCK = "canteen_month_reset"
+MONTH_RESET_LOCK_WAIT = 10     # seconds to wait for another worker's reset
+
+
 def perform_month_reset(today: date):
     days_in_month = get_days_in_month(today.year, today.month)
 
@@ -674,69 +3043,78 @@ def perform_month_reset(today: date):
     # Clear all daily records
     cur.execute("DELETE FROM mess_days")
 
+    # Remember the reset so auto reset won't repeat for this month
+    cur.execute(
+        """
+        INSERT INTO app_meta (id, last_reset) VALUES (1, %s)
+        ON DUPLICATE KEY UPDATE last_reset = VALUES(last_reset)
+        """,
+        (today,),
+    )
+
     conn.commit()
     cur.close()
-    conn.close()
+    MESS_STATUS.invalidate_all()
+    RESPONSES.bump("usage")
 
 
-def monthly_reset():
-    """
-    Auto reset:
-    Runs automatically on 1st of every month (via before_request).
-    Uses app_meta table to ensure it runs only once per month.
-    """
-    today = date.today()
-
-    # Only run on 1st
-    if today.day != 1:
-        return
+def month_reset_lock():
+    return advisory_lock(MONTH_RESET_LOCK, MONTH_RESET_LOCK_WAIT)
 
-    conn = db()
-    cur = conn.cursor(dictionary=True)
 
-    # Ensure app_meta table exists
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS app_meta (
-            id INT PRIMARY KEY,
-            last_reset DATE
-        )
-        """
-    )
-
-    # Read last_reset row
+def read_last_reset():
+    cur = db().cursor()
     cur.execute("SELECT last_reset FROM app_meta WHERE id = 1")
     row = cur.fetchone()
+    cur.close()
+    return row[0] if row else None
 
-    if row is None:
-        cur.execute("INSERT INTO app_meta (id, last_reset) VALUES (1, NULL)")
-        conn.commit()
-        last_reset = None
-    else:
-        last_reset = row["last_reset"]
 
-    # If already reset this month, do nothing
-    if last_reset is not None and last_reset.year == today.year and last_reset.month == today.month:
-        cur.close()
-        conn.close()
-        return
+# ============================================================
+#  MONTHLY RESET SCHEDULER
+#  Background thread (one per worker), NOT on the request path.
+#  Runs on the 1st of every month; after one successful check the
+#  month is remembered in memory, so the rest of the month costs
+#  no DB work at all.
+# ============================================================
+MONTH_RESET_CHECK_SECONDS = int(os.getenv("MONTH_RESET_CHECK_SECONDS", "300"))
 
-    # Perform reset for this month
-    perform_month_reset(today)
+_last_reset_month = None    # (year, month) known to be reset already
 
-    # Update last_reset
-    cur = conn.cursor()
-    cur.execute("UPDATE app_meta SET last_reset = %s WHERE id = 1", (today,))
-    conn.commit()
 
-    cur.close()
-    conn.close()
+def monthly_reset():
+    """Returns True if this call performed the reset."""
+    global _last_reset_month
+    today = date.today()
+    month = (today.year, today.month)
 
+    # Only run on 1st, and only until we know this month is done
+    if today.day != 1 or _last_reset_month == month:
+        return False
 
-# Run monthly_reset automatically before every request
-@app.before_request
-def auto_monthly_reset():
-    monthly_reset()
+    with month_reset_lock() as got:
+        if not got:
+            return False    # someone else is resetting – check again next tick
+
+        # Re-read under the lock: another worker may have just done it
+        last_reset = read_last_reset()
+        did_reset = not (last_reset and (last_reset.year, last_reset.month) == month)
+        if did_reset:
+            perform_month_reset(today)
+
+    _last_reset_month = month
+    return did_reset
+
+
+def _month_reset_loop():
+    while True:
+        try:
+            with app.app_context():
+                if monthly_reset():
+                    app.logger.info("Monthly reset done for %s", date.today())
+        except Exception:
+            app.logger.exception("Monthly reset check failed")
+        time.sleep(MONTH_RESET_CHECK_SECONDS)
 
 
 # ============================================================
@@ -746,33 +3124,97 @@ def auto_monthly_reset():
 # ============================================================
 @app.route("/api/reset-month", methods=["POST", "GET"])
 def reset_month_api():
+    global _last_reset_month
     today = date.today()
 
-    # Run reset
-    perform_month_reset(today)
+    with month_reset_lock() as got:
+        if not got:
+            return jsonify({"status": "busy", "message": "Reset already running"}), 409
+        perform_month_reset(today)
 
-    # Also update app_meta so auto reset won't repeat for this month
-    conn = db()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS app_meta (
-            id INT PRIMARY KEY,
-            last_reset DATE
+    _last_reset_month = (today.year, today.month)
+    return jsonify({"status": "reset_done", "days_in_month": get_days_in_month(today.year, today.month)})
+
+
+# ============================================================
+#  SCAN ENGINE
+#  Validate → mark slot → count day → log, all in ONE transaction
+#  on the request connection. Deadlocks / lock wait timeouts
+#  (two phones scanning the same member at once) are retried.
+# ============================================================
+SCAN_TXN_RETRIES = 3
+RETRYABLE_ERRNOS = (1213, 1205)   # ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT
+
+
+def _scan_decision(cur, member_id, token, slot, day):
+    """
+    Returns (log_message, reply_message, member_row).
+    log_message == "OK" means the scan was accepted and counted.
+    """
+    # 1) Check token exists for this slot & day. The common case –
+    #    the slot-level QR – is answered from the token cache.
+    if token != get_slot_token(slot, day):
+        cur.execute(
+            """
+            SELECT id FROM qr_tokens
+            WHERE token=%s AND slot=%s AND valid_date=%s
+            LIMIT 1
+            """,
+            (token, slot, day),
         )
-        """
+        if not cur.fetchone():
+            return "Invalid or expired QR", "Invalid or expired QR", None
+
+    # 2) Load member & check slot allowed
+    cur.execute(
+        "SELECT name, allowed_slots FROM members WHERE id=%s",
+        (member_id,),
     )
-    cur.execute("SELECT last_reset FROM app_meta WHERE id = 1")
-    row = cur.fetchone()
-    if row is None:
-        cur.execute("INSERT INTO app_meta (id, last_reset) VALUES (1, %s)", (today,))
-    else:
-        cur.execute("UPDATE app_meta SET last_reset = %s WHERE id = 1", (today,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    m = cur.fetchone()
+    if not m:
+        return "Unknown member", "Unknown member", None
 
-    return jsonify({"status": "reset_done", "days_in_month": get_days_in_month(today.year, today.month)})
+    allowed = [s.strip() for s in m["allowed_slots"].split(",") if s.strip()]
+    if slot not in allowed:
+        return "Slot not allowed", "You are not allowed for this slot", m
+
+    # 3) Mark + count; refuses a second scan of the same slot & day
+    if not update_usage(cur, member_id, slot, day):
+        return "Already scanned today", "Already scanned for this slot today", m
+
+    return "OK", "OK", m
+
+
+def run_scan(member_id, token, slot):
+    """
+    Runs the scan decision as one commit, then queues its log row
+    (the write-behind log keeps the INSERT off the latency path).
+    Returns (ok, message, member, scanned_at).
+    """
+    c = db()
+    day = date.today()
+
+    for attempt in range(SCAN_TXN_RETRIES):
+        cur = c.cursor(dictionary=True)
+        try:
+            log_msg, reply_msg, m = _scan_decision(cur, member_id, token, slot, day)
+            ok = log_msg == "OK"
+            if ok:
+                c.commit()
+                MESS_STATUS.invalidate(int(member_id))
+                RESPONSES.bump("usage")
+            else:
+                c.rollback()
+            break
+        except mysql.connector.Error as e:
+            c.rollback()
+            if e.errno not in RETRYABLE_ERRNOS or attempt == SCAN_TXN_RETRIES - 1:
+                raise
+        finally:
+            cur.close()
+
+    scanned_at = save_scan(member_id, token, slot, ok, log_msg, day)
+    return ok, reply_msg, m, scanned_at
 
 
 # ============================================================
@@ -793,80 +3235,23 @@ def validate_scan():
         return jsonify({"success": False, "message": "Missing data"})
 
     slot = get_current_slot()
+    if slot is None:
+        return jsonify({"success": False, "message": "No meal slot right now"})
+    ok, message, m, scanned_at = run_scan(member_id, token, slot)
 
-    # 1) Check slot-level token exists for today
-    c = db()
-    cur = c.cursor(dictionary=True)
-    cur.execute(
-        """
-        SELECT id FROM qr_tokens
-        WHERE token=%s AND slot=%s AND valid_date=%s
-        """,
-        (token, slot, date.today()),
-    )
-    trow = cur.fetchone()
-    cur.close()
-    c.close()
-
-    if not trow:
-        save_scan(member_id, token, slot, False, "Invalid or expired QR")
-        return jsonify({"success": False, "message": "Invalid or expired QR"})
-
-    # 2) Load member & check slot allowed
-    c2 = db()
-    cur2 = c2.cursor(dictionary=True)
-    cur2.execute(
-        "SELECT name, allowed_slots FROM members WHERE id=%s",
-        (member_id,),
-    )
-    m = cur2.fetchone()
-    cur2.close()
-    c2.close()
-
-    if not m:
-        save_scan(member_id, token, slot, False, "Unknown member")
-        return jsonify({"success": False, "message": "Unknown member"})
-
-    allowed = [s.strip() for s in m["allowed_slots"].split(",") if s.strip()]
-    if slot not in allowed:
-        save_scan(member_id, token, slot, False, "Slot not allowed")
-        return jsonify(
-            {"success": False, "message": "You are not allowed for this slot"}
-        )
-
-    # 3) BLOCK DOUBLE SCAN – if this slot already 1 for today, reject
-    c3 = db()
-    cur3 = c3.cursor(dictionary=True)
-    cur3.execute(
-        """
-        SELECT morning,afternoon,evening,night
-        FROM mess_days
-        WHERE member_id=%s AND date=%s
-        """,
-        (member_id, date.today()),
-    )
-    row = cur3.fetchone()
-    cur3.close()
-    c3.close()
-
-    if row:
-        already = row.get(slot, 0)
-        if already == 1:
-            save_scan(member_id, token, slot, False, "Already scanned today")
-            return jsonify(
-                {
-                    "success": False,
-                    "message": "Already scanned for this slot today",
-                }
-            )
-
-    # 4) OK → update usage & log
-    update_usage(member_id, slot)
-    save_scan(member_id, token, slot, True, "OK")
+    if not ok:
+        return jsonify({"success": False, "message": message})
 
     # Member photo for student screen
     photo_url = get_member_photo_url(int(member_id))
 
+    BROKER.publish("scans", "scan", {
+        "member_id": int(member_id),
+        "name": m["name"],
+        "slot": slot,
+        # the row's scanned_at, serialized like /api/logs rows (jsonify)
+        "at": http_date(scanned_at),
+    })
     return jsonify({"success": True, "name": m["name"], "photo": photo_url})
 
 
@@ -875,25 +3260,76 @@ def validate_scan():
 # ============================================================
 @app.route("/api/logs")
 def logs():
+    """
+    Newest scans first, keyset-paginated on (scanned_at, id).
+    Query args (all optional):
+      limit=1..500 (default 200), cursor=<next_cursor from previous page>,
+      slot=, date=YYYY-MM-DD (valid_date), success=0|1, member_id=
+    Returns {"rows": [...], "next_cursor": str|null}.
+    """
+    args = request.args
+    try:
+        limit = min(max(int(args.get("limit", 200)), 1), 500)
+        clauses, params = [], []
+        if args.get("slot"):
+            clauses.append("s.slot = %s")
+            params.append(args["slot"])
+        if args.get("date"):
+            clauses.append("s.valid_date = %s")
+            params.append(date.fromisoformat(args["date"]))
+        if args.get("success") in ("0", "1"):
+            clauses.append("s.success = %s")
+            params.append(int(args["success"]))
+        if args.get("member_id"):
+            clauses.append("s.member_id = %s")
+            params.append(int(args["member_id"]))
+        if args.get("cursor"):
+            ts, last_id = args["cursor"].rsplit("|", 1)
+            ts = datetime.fromisoformat(ts)
+            clauses.append("(s.scanned_at < %s OR (s.scanned_at = %s AND s.id < %s))")
+            params += [ts, ts, int(last_id)]
+    except ValueError:
+        return jsonify({"success": False, "error": "Bad filter or cursor"}), 400
+
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
     c = db()
     cur = c.cursor(dictionary=True)
     cur.execute(
-        """
+        f"""
         SELECT s.*,
             m.name
         FROM scans s
         LEFT JOIN members m ON m.id = s.member_id
-        ORDER BY s.scanned_at DESC
-        LIMIT 200
-        """
+        {where}
+        ORDER BY s.scanned_at DESC, s.id DESC
+        LIMIT %s
+        """,
+        params + [limit + 1],
     )
     rows = cur.fetchall()
     cur.close()
-    c.close()
-    return jsonify(rows)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = f"{last['scanned_at'].isoformat()}|{last['id']}"
+
+    return jsonify({"rows": rows, "next_cursor": next_cursor})
+
+
 @app.route("/api/mess-status")
 def mess_status():
-    member_id = request.args.get("id", 1)
+    empty = {"used_days": 0, "remaining": 0, "carry_forward": 0, "paid_days": 0}
+    try:
+        member_id = int(request.args.get("id", 1))
+    except ValueError:
+        return jsonify(empty)
+
+    row = MESS_STATUS.get(member_id)
+    if row:
+        return jsonify(row)
 
     c = db()
     cur = c.cursor(dictionary=True)
@@ -906,22 +3342,21 @@ def mess_status():
     )
     row = cur.fetchone()
     cur.close()
-    c.close()
 
     if not row:
-        return jsonify(
-            {"used_days": 0, "remaining": 0, "carry_forward": 0, "paid_days": 0}
-        )
+        return jsonify(empty)
 
     # Paid days = current month's paid days = remaining + used
     row["paid_days"] = row["used_days"] + row["remaining"]
+    MESS_STATUS.put(member_id, row)
     return jsonify(row)
 
 
 @app.route("/api/mess-overview")
+@cached_response("members", "usage")
 def mess_overview():
     c = db()
-    cur = c.cursor(dictionary=True)
+    cur = c.cursor()
     cur.execute(
         """
         SELECT id, name, used_days, remaining, carry_forward
@@ -929,76 +3364,686 @@ def mess_overview():
         ORDER BY name
         """
     )
-    rows = cur.fetchall()
+    rows = [OverviewRow(*r) for r in cur.fetchall()]
     cur.close()
-    c.close()
-    return jsonify(rows)
+    return json_list(rows)
 
 
 # ============================================================
-#  EXPORT LOGS → CSV (Excel) + CLEAR SCANS
+#  EXPORT LOGS → CSV (Excel) / XLSX
+#  GET  /api/export-logs/bounds  → {max_id, rows} for the filters
+#  GET  /api/export-logs         → streamed file
+#  POST /api/clear-logs          → batched delete of an exported range
+#  Filters (all optional): from=YYYY-MM-DD, to=YYYY-MM-DD (inclusive),
+#  max_id=N (pin the export/delete to rows that existed at export time)
 # ============================================================
+EXPORT_FETCH_CHUNK = 1000
+CLEAR_LOGS_BATCH = 5000
+
+EXPORT_HEADER = [
+    "Scan ID",
+    "Scanned At",
+    "Valid Date",
+    "Slot",
+    "Success",
+    "Message",
+    "Member Name",
+    "Roll / ID",
+]
+
+
+def scan_range_filter(args, prefix="s."):
+    """
+    Builds the WHERE clause for the export filters.
+    Raises ValueError on a malformed date / id.
+    """
+    clauses, params = [], []
+    if args.get("from"):
+        clauses.append(f"{prefix}scanned_at >= %s")
+        params.append(date.fromisoformat(args["from"]))
+    if args.get("to"):
+        clauses.append(f"{prefix}scanned_at < %s")
+        params.append(date.fromisoformat(args["to"]) + timedelta(days=1))
+    if args.get("max_id"):
+        clauses.append(f"{prefix}id <= %s")
+        params.append(int(args["max_id"]))
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    return where, params
+
+
+def iter_export_rows(where, params):
+    """
+    Yields chunks of export rows from an unbuffered cursor on its own
+    pooled connection (the response body outlives the request).
+    If the download stops early the rest of the result is still
+    unread on the connection, so it is closed rather than reused:
+    draining a large export could take longer than the export did.
+    """
+    conn = POOL.acquire()
+    finished = False
+    try:
+        cur = conn.cursor(buffered=False)
+        cur.execute(
+            f"""
+            SELECT s.id, s.scanned_at, s.valid_date, s.slot, s.success, s.message,
+                   m.name, m.roll_or_id
+            FROM scans s
+            LEFT JOIN members m ON m.id = s.member_id
+            {where}
+            ORDER BY s.id ASC
+            """,
+            params,
+        )
+        while True:
+            rows = cur.fetchmany(EXPORT_FETCH_CHUNK)
+            if not rows:
+                break
+            yield rows
+        cur.close()
+        finished = True
+    finally:
+        if finished:
+            POOL.release(conn)
+        else:
+            POOL.discard(conn)
+
+
+def _export_row(r):
+    sid, scanned_at, valid_date, slot, success, message, name, roll = r
+    return [sid, str(scanned_at or ""), str(valid_date or ""), slot or "",
+            success, message or "", name or "", roll or ""]
+
+
+def stream_csv(where, params):
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_HEADER)
+    for rows in iter_export_rows(where, params):
+        writer.writerows(_export_row(r) for r in rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def build_xlsx(where, params):
+    """Writes the export with xlsxwriter in constant-memory mode; returns the temp path."""
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    wb = xlsxwriter.Workbook(path, {"constant_memory": True})
+    ws = wb.add_worksheet("Scans")
+    ws.write_row(0, 0, EXPORT_HEADER)
+    n = 1
+    for rows in iter_export_rows(where, params):
+        for r in rows:
+            ws.write_row(n, 0, _export_row(r))
+            n += 1
+    wb.close()
+    return path
+
+
+def stream_file_and_delete(path, chunk=64 * 1024):
+    try:
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(chunk)
+                if not data:
+                    break
+                yield data
+    finally:
+        os.remove(path)
+
+
+@app.route("/api/export-logs/bounds")
+def export_logs_bounds():
+    try:
+        where, params = scan_range_filter(request.args)
+    except ValueError:
+        return jsonify({"success": False, "error": "Bad date or id"}), 400
+
+    cur = db().cursor()
+    cur.execute(f"SELECT MAX(s.id), COUNT(*) FROM scans s {where}", params)
+    max_id, count = cur.fetchone()
+    cur.close()
+    return jsonify({"max_id": max_id, "rows": count})
+
+
 @app.route("/api/export-logs")
 def export_logs():
-    conn = db()
-    cur = conn.cursor(dictionary=True)
+    try:
+        where, params = scan_range_filter(request.args)
+    except ValueError:
+        return jsonify({"success": False, "error": "Bad date or id"}), 400
+
+    fmt = request.args.get("format", "csv").lower()
+    if fmt == "xlsx":
+        if xlsxwriter is None:
+            return jsonify({"success": False, "error": "XLSX export needs the xlsxwriter package"}), 400
+        path = build_xlsx(where, params)
+        return Response(
+            stream_file_and_delete(path),
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": "attachment; filename=scan_logs.xlsx"},
+        )
+
+    return Response(
+        stream_csv(where, params),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=scan_logs.csv"},
+    )
+
+
+@app.route("/api/clear-logs", methods=["POST"])
+def clear_logs():
+    """
+    Deletes exported scans in small batches (short locks, one commit each).
+    Needs an upper bound (to or max_id) – never clears the table blindly.
+    """
+    if not (request.args.get("to") or request.args.get("max_id")):
+        return jsonify({"success": False, "error": "Give 'to' or 'max_id'"}), 400
+    try:
+        where, params = scan_range_filter(request.args, prefix="")
+    except ValueError:
+        return jsonify({"success": False, "error": "Bad date or id"}), 400
+
+    c = db()
+    cur = c.cursor()
+    deleted = 0
+    while True:
+        cur.execute(
+            f"DELETE FROM scans {where} ORDER BY id LIMIT %s",
+            params + [CLEAR_LOGS_BATCH],
+        )
+        c.commit()
+        deleted += cur.rowcount
+        if cur.rowcount < CLEAR_LOGS_BATCH:
+            break
+    cur.close()
+    return jsonify({"success": True, "deleted": deleted})
+
+
+# ============================================================
+#  LIVE EVENTS (Server-Sent Events)
+#  GET /api/events?channels=qr,scans
+#    qr    → "slot" event at every slot rollover / QR rotation
+#    scans → "scan" event for every accepted scan
+#  In-process pub/sub: each subscriber has a small queue; a client
+#  too slow to keep up loses events rather than blocking publishers.
+#  Needs a threaded worker (see Procfile) – each stream holds one.
+# ============================================================
+SSE_CHANNELS = ("qr", "scans")
+SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", "8"))
+SSE_KEEPALIVE_SECONDS = 15
+
+
+class EventBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subs = {}            # queue -> set(channels)
+        self._counters = {"published": 0, "delivered": 0, "dropped": 0}
+
+    def subscribe(self, channels):
+        q = queue.Queue(self.queue_size)
+        with self._lock:
+            self._subs[q] = set(channels)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subs.pop(q, None)
+
+    def subscribers(self, channel=None):
+        with self._lock:
+            return sum(1 for chans in self._subs.values() if channel is None or channel in chans)
+
+    def publish(self, channel, event, data, local=False):
+        """
+        With a shared cache backend the event goes through its bus and
+        comes back to deliver() on every worker. local=True skips the bus
+        (for events each worker produces by itself, like slot rollovers).
+        """
+        message = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        if CACHE.shared and not local:
+            CACHE.publish(channel, message)
+        else:
+            self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self._lock:
+            targets = [q for q, chans in self._subs.items() if channel in chans]
+            self._counters["published"] += 1
+        for q in targets:
+            try:
+                q.put_nowait(message)
+                self._counters["delivered"] += 1
+            except queue.Full:
+                self._counters["dropped"] += 1
+
+    def stats(self):
+        return {"subscribers": self.subscribers(), **self._counters}
+
+
+BROKER = EventBroker()
+register_stats("events", BROKER.stats)
+
+
+def publish_slot_qr(local=False):
+    """
+    Push the current slot's QR to kiosks (app context needed for a token
+    miss). Kiosks show the pushed data URL as is; "etag" matches the
+    /api/slot-qr.png ETag so their fallback poll sees no change.
+    """
+    slot, seconds_left = current_slot_info()
+    data = {"slot": slot, "qr": None, "etag": None, "next_change_in": round(seconds_left)}
+    if slot is not None:
+        token = get_slot_token(slot) or create_slot_token(slot)
+        qr = QR_IMAGES.get(token)
+        data["qr"], data["etag"] = qr["data_url"], qr["etag"]
+    BROKER.publish("qr", "slot", data, local=local)
+
+
+def _slot_rollover_loop():
+    while True:
+        _, seconds_left = current_slot_info()
+        if SLOT_PREGEN_SECONDS and seconds_left > SLOT_PREGEN_SECONDS:
+            time.sleep(seconds_left - SLOT_PREGEN_SECONDS)
+            _, seconds_left = current_slot_info()
+            try:
+                with app.app_context():
+                    prepare_next_slot(seconds_left)
+            except Exception:
+                app.logger.exception("Next slot pre-generation failed")
+        time.sleep(seconds_left + 0.5)
+        if not BROKER.subscribers("qr"):
+            continue
+        try:
+            with app.app_context():
+                publish_slot_qr(local=True)
+        except Exception:
+            app.logger.exception("Slot rollover push failed")
+
+
+@app.route("/api/events")
+def events():
+    channels = [c for c in request.args.get("channels", "qr,scans").split(",") if c in SSE_CHANNELS]
+    if not channels:
+        return jsonify({"success": False, "error": "No valid channels"}), 400
+    if BROKER.subscribers() >= SSE_MAX_CLIENTS:
+        return jsonify({"success": False, "error": "Too many live clients"}), 503
+
+    q = BROKER.subscribe(channels)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    yield q.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            BROKER.unsubscribe(q)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ============================================================
+#  SCHEMA MIGRATIONS
+#  Numbered steps applied once each, in order, and recorded in
+#  schema_migrations. Each step also has to be safe on databases
+#  that already hold part of it: older deployments built their
+#  tables by hand. A new entry in SCHEMA_INDEXES needs a new step
+#  that runs ensure_indexes again.
+#  After migrating, check_schema() confirms every index exists
+#  and that EXPLAIN can use it for the hot queries. With
+#  SCHEMA_STRICT=1 a failed check stops the worker from booting.
+# ============================================================
+# (table, index name, columns, unique)
+SCHEMA_INDEXES = [
+    # /api/logs keyset pages: plain, and one per filter
+    ("scans", "idx_scans_scanned_at", "scanned_at, id", False),
+    ("scans", "idx_scans_slot_scanned_at", "slot, scanned_at, id", False),
+    ("scans", "idx_scans_valid_date_scanned_at", "valid_date, scanned_at, id", False),
+    ("scans", "idx_scans_success_scanned_at", "success, scanned_at, id", False),
+    ("scans", "idx_scans_member_scanned_at", "member_id, scanned_at, id", False),
+    # /api/login fallback when a roll is not in the index
+    ("members", "idx_members_roll", "roll_or_id", False),
+    # scan token check (all three) and slot-level token lookup (prefix)
+    ("qr_tokens", "idx_qr_tokens_slot_day_token", "slot, valid_date, token", False),
+]
+
+# Unique keys added by their own migrations (they clean up duplicates
+# first); listed here so check_schema() verifies them too.
+SCHEMA_KEYS = [
+    ("mess_days", "uq_mess_days_member_date", "member_id, date", True),
+    ("qr_tokens", "uq_qr_tokens_slot_day", "slot_scope, valid_date", True),
+]
+
+
+def index_exists(cur, table, name):
     cur.execute(
         """
-        SELECT s.id, s.scanned_at, s.valid_date, s.slot, s.success, s.message,
-               m.name, m.roll_or_id
-        FROM scans s
-        LEFT JOIN members m ON m.id = s.member_id
-        ORDER BY s.scanned_at ASC
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE()
+          AND table_name = %s
+          AND index_name = %s
+        LIMIT 1
+        """,
+        (table, name),
+    )
+    return cur.fetchone() is not None
+
+
+def ensure_indexes(cur):
+    for table, name, columns, unique in SCHEMA_INDEXES:
+        if not index_exists(cur, table, name):
+            kind = "UNIQUE KEY" if unique else "INDEX"
+            app.logger.info("Adding %s %s on %s(%s)", kind, name, table, columns)
+            cur.execute(f"ALTER TABLE {table} ADD {kind} {name} ({columns})")
+
+
+def ensure_mess_day_unique_key(cur):
+    """
+    The scan engine upserts mess_days, which needs UNIQUE(member_id, date).
+    Older databases may hold duplicate day rows (from the previous
+    check-then-insert race): their slot flags are merged into the
+    oldest row and the rest are dropped before the key is added.
+    """
+    if index_exists(cur, "mess_days", "uq_mess_days_member_date"):
+        return
+
+    cur.execute(
+        """
+        UPDATE mess_days keep_row
+        JOIN (
+            SELECT MIN(id) AS id,
+                   MAX(morning) AS morning, MAX(afternoon) AS afternoon,
+                   MAX(evening) AS evening, MAX(night) AS night,
+                   MAX(consumed) AS consumed
+            FROM mess_days
+            GROUP BY member_id, date
+            HAVING COUNT(*) > 1
+        ) dup ON dup.id = keep_row.id
+        SET keep_row.morning = dup.morning,
+            keep_row.afternoon = dup.afternoon,
+            keep_row.evening = dup.evening,
+            keep_row.night = dup.night,
+            keep_row.consumed = dup.consumed
+        """
+    )
+    cur.execute(
+        """
+        DELETE d1 FROM mess_days d1
+        JOIN mess_days d2
+          ON d1.member_id = d2.member_id AND d1.date = d2.date AND d1.id > d2.id
+        """
+    )
+    cur.execute(
+        """
+        ALTER TABLE mess_days
+        ADD UNIQUE KEY uq_mess_days_member_date (member_id, date)
         """
     )
-    rows = cur.fetchall()
 
-    # Build CSV in memory
-    output = []
-    header = [
-        "Scan ID",
-        "Scanned At",
-        "Valid Date",
-        "Slot",
-        "Success",
-        "Message",
-        "Member Name",
-        "Roll / ID",
-    ]
-    output.append(header)
-
-    for r in rows:
-        output.append([
-            r["id"],
-            str(r.get("scanned_at") or ""),
-            str(r.get("valid_date") or ""),
-            r.get("slot") or "",
-            r.get("success"),
-            r.get("message") or "",
-            r.get("name") or "",
-            r.get("roll_or_id") or "",
-        ])
-
-    # Convert to CSV string
-    csv_buf = []
-    for row in output:
-        # naive CSV join (OK for simple data)
-        csv_buf.append(",".join([str(x).replace(",", " ") for x in row]))
-    csv_data = "\n".join(csv_buf)
-
-    # CLEAR ALL SCANS after export
-    cur2 = conn.cursor()
-    cur2.execute("DELETE FROM scans")
-    conn.commit()
-    cur2.close()
-    cur.close()
-    conn.close()
 
-    return Response(
-        csv_data,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=scan_logs.csv"},
+def ensure_slot_token_unique_key(cur):
+    """
+    One slot-level token per (slot, date). slot_scope is the slot for
+    slot-level rows and NULL for member rows, so member tokens (which
+    /api/member/generate re-issues freely) are not constrained.
+    Existing duplicates keep their oldest row.
+    """
+    if index_exists(cur, "qr_tokens", "uq_qr_tokens_slot_day"):
+        return
+
+    cur.execute(
+        """
+        DELETE t1 FROM qr_tokens t1
+        JOIN qr_tokens t2
+          ON t1.slot = t2.slot AND t1.valid_date = t2.valid_date AND t1.id > t2.id
+        WHERE t1.member_id IS NULL AND t2.member_id IS NULL
+        """
+    )
+    cur.execute(
+        """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE()
+          AND table_name = 'qr_tokens'
+          AND column_name = 'slot_scope'
+        """
+    )
+    if cur.fetchone() is None:
+        cur.execute(
+            """
+            ALTER TABLE qr_tokens
+            ADD COLUMN slot_scope VARCHAR(16)
+                AS (IF(member_id IS NULL, slot, NULL)) STORED
+            """
+        )
+    cur.execute(
+        """
+        ALTER TABLE qr_tokens
+        ADD UNIQUE KEY uq_qr_tokens_slot_day (slot_scope, valid_date)
+        """
+    )
+
+
+SCHEMA_STRICT = os.getenv("SCHEMA_STRICT", "0") == "1"
+SCHEMA_LOCK = "canteen_schema_migrate"
+SCHEMA_LOCK_WAIT = 60
+
+BASE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS members (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        roll_or_id VARCHAR(50) NOT NULL,
+        allowed_slots VARCHAR(100) NOT NULL,
+        used_days INT NOT NULL DEFAULT 0,
+        remaining INT NOT NULL DEFAULT 0,
+        carry_forward INT NOT NULL DEFAULT 0,
+        device_id VARCHAR(100) NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS qr_tokens (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        member_id INT NULL,
+        token VARCHAR(64) NOT NULL,
+        slot VARCHAR(16) NOT NULL,
+        valid_date DATE NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS mess_days (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        member_id INT NOT NULL,
+        date DATE NOT NULL,
+        morning TINYINT NOT NULL DEFAULT 0,
+        afternoon TINYINT NOT NULL DEFAULT 0,
+        evening TINYINT NOT NULL DEFAULT 0,
+        night TINYINT NOT NULL DEFAULT 0,
+        consumed TINYINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS scans (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        member_id INT NULL,
+        token VARCHAR(64) NULL,
+        slot VARCHAR(16) NULL,
+        valid_date DATE NULL,
+        success TINYINT NOT NULL DEFAULT 0,
+        message VARCHAR(255) NULL,
+        scanned_at DATETIME NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS menu (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        title VARCHAR(100) NOT NULL,
+        description TEXT NULL,
+        available TINYINT NOT NULL DEFAULT 1
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS app_meta (
+        id INT PRIMARY KEY,
+        last_reset DATE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS slot_schedule (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        weekday TINYINT NULL,
+        slot VARCHAR(16) NOT NULL,
+        start_time TIME NOT NULL,
+        end_time TIME NOT NULL
+    )
+    """,
+]
+
+
+def create_base_tables(cur):
+    for ddl in BASE_TABLES:
+        cur.execute(ddl)
+
+
+# (version, description, step(cur))
+MIGRATIONS = [
+    (1, "base tables", create_base_tables),
+    (2, "mess_days unique (member_id, date)", ensure_mess_day_unique_key),
+    (3, "qr_tokens one slot-level token per (slot, date)", ensure_slot_token_unique_key),
+    (4, "hot-path indexes", ensure_indexes),
+]
+
+# Hot queries and the index EXPLAIN must be able to use for them
+# (name, sql, sample params, index). Full-key equality lookups on a
+# unique key (the mess day row) are left out: MySQL resolves them as
+# const, and when the sample row is absent EXPLAIN reports no key at
+# all. SCHEMA_KEYS already checks that those keys exist.
+HOT_QUERIES = [
+    ("login by roll", "SELECT id, name, device_id FROM members WHERE roll_or_id = %s",
+     ("x",), "idx_members_roll"),
+    ("scan token check", "SELECT id FROM qr_tokens WHERE token=%s AND slot=%s AND valid_date=%s LIMIT 1",
+     ("x", "morning", date(2000, 1, 1)), "idx_qr_tokens_slot_day_token"),
+    ("slot token", "SELECT token FROM qr_tokens WHERE member_id IS NULL AND slot=%s AND valid_date=%s LIMIT 1",
+     ("morning", date(2000, 1, 1)), "idx_qr_tokens_slot_day_token"),
+    ("recent logs", "SELECT id FROM scans ORDER BY scanned_at DESC, id DESC LIMIT 50",
+     (), "idx_scans_scanned_at"),
+]
+
+_schema_state = {"version": None, "strict": SCHEMA_STRICT, "problems": []}
+register_stats("schema", lambda: {**_schema_state, "problems": len(_schema_state["problems"])})
+
+
+def migrate(conn):
+    """Applies pending MIGRATIONS (one worker at a time). Returns the schema version."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+        """
     )
+    cur.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_LOCK, SCHEMA_LOCK_WAIT))
+    if cur.fetchone()[0] != 1:
+        raise RuntimeError("Timed out waiting for another worker's schema migration")
+    try:
+        cur.execute("SELECT version FROM schema_migrations")
+        done = {v for (v,) in cur.fetchall()}
+        for version, name, step in MIGRATIONS:
+            if version in done:
+                continue
+            app.logger.info("Schema migration %d: %s", version, name)
+            step(cur)
+            cur.execute(
+                "INSERT INTO schema_migrations(version, name, applied_at) VALUES(%s,%s,%s)",
+                (version, name, datetime.now()),
+            )
+            conn.commit()
+            done.add(version)
+    finally:
+        cur.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK,))
+        cur.fetchone()
+        cur.close()
+    return max(done, default=0)
+
+
+def check_schema(conn):
+    """List of problems: missing indexes, hot queries EXPLAIN can't serve from their index."""
+    problems = []
+    cur = conn.cursor(dictionary=True)
+    for table, name, columns, unique in SCHEMA_INDEXES + SCHEMA_KEYS:
+        if not index_exists(cur, table, name):
+            problems.append(f"missing index {name} on {table}({columns})")
+
+    for label, sql, params, index in HOT_QUERIES:
+        cur.execute("EXPLAIN " + sql, params)
+        plan = cur.fetchall()
+        usable = set()
+        for row in plan:
+            usable.update(k for k in (row.get("possible_keys") or "").split(",") if k)
+            if row.get("key"):
+                usable.add(row["key"])
+        if index not in usable:
+            problems.append(f"{label}: EXPLAIN can't use {index} (plan: {[r.get('key') for r in plan]})")
+    cur.close()
+    return problems
+
+
+# ============================================================
+#  STARTUP TASKS
+#  Run once per worker at import. If the DB is down we only log;
+#  the app still boots and the pool connects on first request.
+# ============================================================
+def run_startup_tasks():
+    try:
+        with POOL.connection() as conn:
+            _schema_state["version"] = migrate(conn)
+            problems = _schema_state["problems"] = check_schema(conn)
+            cur = conn.cursor()
+            load_slot_schedule(cur)
+            ROLLS.load(cur)
+            cur.close()
+    except mysql.connector.Error as e:
+        app.logger.warning("Startup tasks skipped (DB unavailable): %s", e)
+        return
+
+    for p in problems:
+        app.logger.warning("Schema check: %s", p)
+    if problems and SCHEMA_STRICT:
+        raise RuntimeError(f"Schema check failed ({len(problems)} problem(s)); see log")
+
+
+# Set BACKGROUND_JOBS=0 for one-off scripts that import the app
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "1") != "0"
+
+
+def start_background_jobs():
+    threading.Thread(target=_month_reset_loop, name="month-reset", daemon=True).start()
+    SCAN_LOG.start()
+    threading.Thread(target=_slot_rollover_loop, name="slot-rollover", daemon=True).start()
+    threading.Thread(target=_usage_reconcile_loop, name="usage-reconcile", daemon=True).start()
+    if CACHE.shared:
+        CACHE.listen(BROKER.deliver)
+    backfill_photo_variants()
+
+
+# `python app.py`: render pool children re-run this file as
+# __mp_main__ and must not migrate or start jobs of their own
+if __name__ != "__mp_main__":
+    run_startup_tasks()
+    if BACKGROUND_JOBS:
+        start_background_jobs()
 
 
 # ============================================================
@@ -0,0 +1,314 @@
+# ================================
+#  SCAN PATH BENCHMARK
+#  Replays a meal-time rush against the scan path and reports
+#  throughput and p50/p95/p99 latency per endpoint.
+#
+#  Every simulated student: /api/login → /api/mess-status →
+#  /api/validate → /api/mess-status. Arrivals follow a triangular
+#  rush over --burst-seconds (fixed RNG seed, so runs are
+#  repeatable) while --kiosks poll /api/get-slot-qr.
+#
+#  In-process (default): seeds BENCH_MYSQL_NAME, imports the app
+#  against it and drives it through Flask's test client.
+#      python bench/run.py
+#
+#  Against a running server: seed first, start the server on the
+#  bench database with a schedule that makes a slot current now,
+#  then point the runner at it.
+#      python bench/seed.py
+#      MYSQL_NAME=canteen_bench SLOT_SCHEDULE='[{"slot": "morning",
+#        "start": "00:00", "end": "00:00"}]' gunicorn -c gunicorn.conf.py app:app
+#      python bench/run.py --url http://127.0.0.1:5000 --no-seed
+#
+#  --save-baseline writes bench/baseline.json; later runs compare
+#  against it and exit 1 when p95 or throughput regress by more
+#  than --tolerance, or when more than 1% of requests fail.
+# ================================
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import seed as bench_seed  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+ALL_DAY_SCHEDULE = '[{"slot": "morning", "start": "00:00", "end": "00:00"}]'
+MAX_ERROR_RATE = 0.01
+
+
+# -----------------------------
+# CLIENTS
+# -----------------------------
+class InProcessClient:
+    """Drives the app through Flask's test client (one per thread)."""
+
+    def __init__(self):
+        # The app writes uploads / spill files relative to the cwd
+        os.chdir(tempfile.mkdtemp(prefix="canteen_bench_"))
+        os.environ["MYSQL_NAME"] = bench_seed.BENCH_DB
+        os.environ.setdefault("SLOT_SCHEDULE", ALL_DAY_SCHEDULE)
+        sys.path.insert(0, REPO_ROOT)
+        import app as canteen
+
+        self.app = canteen.app
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def get(self, path):
+        r = self._client().get(path)
+        return r.status_code, r.get_json(silent=True)
+
+    def post_json(self, path, body):
+        r = self._client().post(path, json=body)
+        return r.status_code, r.get_json(silent=True)
+
+
+class HttpClient:
+    """Keep-alive HTTP connection per thread."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._local = threading.local()
+
+    def _request(self, method, path, body=None):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self._local.conn = None
+            conn.close()
+            raise
+        try:
+            return resp.status, json.loads(data)
+        except ValueError:
+            return resp.status, None
+
+    def get(self, path):
+        return self._request("GET", path)
+
+    def post_json(self, path, body):
+        return self._request("POST", path, json.dumps(body))
+
+
+# -----------------------------
+# RUN
+# -----------------------------
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)     # endpoint -> [ms]
+        self.errors = defaultdict(int)
+
+    def call(self, endpoint, fn, check=None):
+        t0 = time.perf_counter()
+        try:
+            status, data = fn()
+            ok = status == 200 and (check is None or check(data))
+        except Exception:
+            data, ok = None, False
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.samples[endpoint].append(ms)
+            if not ok:
+                self.errors[endpoint] += 1
+        return data
+
+
+def slot_token(slot):
+    """The slot QR token the kiosks are showing (read from the bench DB)."""
+    conn = bench_seed.connect(bench_seed.BENCH_DB)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT token FROM qr_tokens
+        WHERE member_id IS NULL AND slot=%s AND valid_date=%s
+        LIMIT 1
+        """,
+        (slot, date.today()),
+    )
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+    return row[0] if row else None
+
+
+def student(client, rec, member_id, token):
+    roll = f"B{member_id:05d}"
+    rec.call("login", lambda: client.get(f"/api/login?roll={roll}&device_id=bench-{roll}"),
+             lambda d: d and d.get("success"))
+    rec.call("mess-status", lambda: client.get(f"/api/mess-status?id={member_id}"))
+    rec.call("validate", lambda: client.post_json("/api/validate", {"token": token, "member_id": member_id}),
+             lambda d: d and d.get("success"))
+    rec.call("mess-status", lambda: client.get(f"/api/mess-status?id={member_id}"))
+
+
+def kiosk(client, rec, interval, stop):
+    while not stop.is_set():
+        rec.call("get-slot-qr", lambda: client.get("/api/get-slot-qr"), lambda d: d and d.get("qr"))
+        stop.wait(interval)
+
+
+def run_burst(client, args):
+    status, current = client.get("/api/current-slot")
+    slot = current and current.get("slot")
+    if not slot:
+        sys.exit("No slot is current on the target; start it with SLOT_SCHEDULE set (see header)")
+    client.get("/api/get-slot-qr")          # makes sure today's slot token exists
+    token = slot_token(slot)
+    if not token:
+        sys.exit(f"No slot token for {slot} in {bench_seed.BENCH_DB}")
+
+    rng = random.Random(args.seed)
+    members = rng.sample(range(1, args.members + 1), min(args.students, args.members))
+    arrivals = sorted(rng.triangular(0, args.burst_seconds, args.burst_seconds / 3) for _ in members)
+
+    rec = Recorder()
+    stop = threading.Event()
+    kiosks = [threading.Thread(target=kiosk, args=(client, rec, args.kiosk_interval, stop)) for _ in range(args.kiosks)]
+    for k in kiosks:
+        k.start()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for at, mid in zip(arrivals, members):
+            delay = at - (time.perf_counter() - t0)
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(student, client, rec, mid, token)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    for k in kiosks:
+        k.join()
+    return rec, elapsed
+
+
+# -----------------------------
+# REPORT + BASELINE
+# -----------------------------
+def percentile(sorted_ms, p):
+    if not sorted_ms:
+        return None
+    return sorted_ms[min(len(sorted_ms) - 1, int(round(p / 100 * (len(sorted_ms) - 1))))]
+
+
+def summarize(rec, elapsed):
+    endpoints = {}
+    for name, samples in sorted(rec.samples.items()):
+        ms = sorted(samples)
+        endpoints[name] = {
+            "requests": len(ms),
+            "errors": rec.errors[name],
+            "rps": round(len(ms) / elapsed, 1),
+            "p50_ms": round(percentile(ms, 50), 2),
+            "p95_ms": round(percentile(ms, 95), 2),
+            "p99_ms": round(percentile(ms, 99), 2),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "endpoints": endpoints,
+    }
+
+
+def print_summary(summary):
+    print(f"{'endpoint':<14}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, e in summary["endpoints"].items():
+        print(f"{name:<14}{e['requests']:>7}{e['errors']:>6}{e['rps']:>9}{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}")
+    print(f"total {summary['requests']} requests in {summary['elapsed_s']} s → {summary['rps']} req/s, {summary['errors']} errors")
+
+
+def compare(summary, baseline, tolerance):
+    """Returns a list of regressions (empty = pass)."""
+    problems = []
+    if summary["requests"] and summary["errors"] / summary["requests"] > MAX_ERROR_RATE:
+        problems.append(f"error rate {summary['errors']}/{summary['requests']} above {MAX_ERROR_RATE:.0%}")
+    if baseline is None:
+        return problems
+    for name, base in baseline["endpoints"].items():
+        cur = summary["endpoints"].get(name)
+        if cur is None:
+            problems.append(f"{name}: no samples")
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {cur['p95_ms']} ms vs baseline {base['p95_ms']} ms")
+    if summary["rps"] < baseline["rps"] * (1 - tolerance):
+        problems.append(f"throughput {summary['rps']} req/s vs baseline {baseline['rps']} req/s")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Meal-rush benchmark for the scan path")
+    parser.add_argument("--url", help="benchmark a running server instead of the app in-process")
+    parser.add_argument("--no-seed", action="store_true", help="reuse the data already in the bench DB")
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--students", type=int, default=600, help="students arriving in the rush")
+    parser.add_argument("--burst-seconds", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--kiosks", type=int, default=2)
+    parser.add_argument("--kiosk-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        counts = bench_seed.seed(args.members, args.days, args.seed)
+        print(f"Seeded {bench_seed.BENCH_DB}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+    client = HttpClient(args.url) if args.url else InProcessClient()
+    rec, elapsed = run_burst(client, args)
+    summary = summarize(rec, elapsed)
+    summary["params"] = {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline", "json", "no_seed")}
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("params") != summary["params"]:
+            print("warning: baseline was recorded with different parameters")
+    problems = compare(summary, baseline, args.tolerance)
+    for p in problems:
+        print("REGRESSION:", p)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
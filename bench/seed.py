@@ -0,0 +1,180 @@
+# ================================
+#  BENCHMARK DATA SEEDER
+#  Recreates the canteen tables in a throwaway database and fills
+#  them with synthetic members and a month of mess_days / scans.
+#
+#    MYSQL_HOST=... MYSQL_USER=... MYSQL_PASSWORD=... \
+#    python bench/seed.py --members 1000 --days 30
+#
+#  Uses BENCH_MYSQL_NAME (default canteen_bench), never MYSQL_NAME:
+#  every table in it is dropped.
+# ================================
+import argparse
+import calendar
+import os
+import random
+import sys
+from datetime import date, datetime, time, timedelta
+
+import mysql.connector
+
+BENCH_DB = os.getenv("BENCH_MYSQL_NAME", "canteen_bench")
+SLOTS = ("morning", "afternoon", "evening", "night")
+SLOT_TIMES = {"morning": time(8, 0), "afternoon": time(13, 0), "evening": time(17, 0), "night": time(20, 30)}
+INSERT_BATCH = 1000
+
+# Bare tables, as on an old hand-built deployment. schema_migrations is
+# dropped too, so the app's startup migrations add every index and key.
+SCHEMA = [
+    "DROP TABLE IF EXISTS scans, mess_days, qr_tokens, members, menu, app_meta, slot_schedule, schema_migrations",
+    """
+    CREATE TABLE members (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        roll_or_id VARCHAR(50) NOT NULL,
+        allowed_slots VARCHAR(100) NOT NULL,
+        used_days INT NOT NULL DEFAULT 0,
+        remaining INT NOT NULL DEFAULT 0,
+        carry_forward INT NOT NULL DEFAULT 0,
+        device_id VARCHAR(100) NULL
+    )
+    """,
+    """
+    CREATE TABLE qr_tokens (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        member_id INT NULL,
+        token VARCHAR(64) NOT NULL,
+        slot VARCHAR(16) NOT NULL,
+        valid_date DATE NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE mess_days (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        member_id INT NOT NULL,
+        date DATE NOT NULL,
+        morning TINYINT NOT NULL DEFAULT 0,
+        afternoon TINYINT NOT NULL DEFAULT 0,
+        evening TINYINT NOT NULL DEFAULT 0,
+        night TINYINT NOT NULL DEFAULT 0,
+        consumed TINYINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE scans (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        member_id INT NULL,
+        token VARCHAR(64) NULL,
+        slot VARCHAR(16) NULL,
+        valid_date DATE NULL,
+        success TINYINT NOT NULL DEFAULT 0,
+        message VARCHAR(255) NULL,
+        scanned_at DATETIME NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE menu (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        title VARCHAR(100) NOT NULL,
+        description TEXT NULL,
+        available TINYINT NOT NULL DEFAULT 1
+    )
+    """,
+]
+
+
+def connect(database=None):
+    return mysql.connector.connect(
+        host=os.getenv("MYSQL_HOST", "127.0.0.1"),
+        user=os.getenv("MYSQL_USER"),
+        password=os.getenv("MYSQL_PASSWORD"),
+        port=os.getenv("MYSQL_PORT", "3306"),
+        database=database,
+    )
+
+
+def check_bench_db():
+    if BENCH_DB == os.getenv("MYSQL_NAME"):
+        sys.exit(f"BENCH_MYSQL_NAME must not be the app database ({BENCH_DB}): seeding drops every table")
+
+
+def _insert(cur, sql, rows):
+    for i in range(0, len(rows), INSERT_BATCH):
+        cur.executemany(sql, rows[i:i + INSERT_BATCH])
+
+
+def seed(members=1000, days=30, seed_value=42):
+    """
+    Drops and refills BENCH_DB. Every member may eat every slot; on
+    each past day each slot is eaten with 80% probability. used_days
+    and remaining agree with mess_days. Returns row counts.
+    """
+    check_bench_db()
+    rng = random.Random(seed_value)
+    today = date.today()
+    paid_days = calendar.monthrange(today.year, today.month)[1]
+
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute(f"CREATE DATABASE IF NOT EXISTS `{BENCH_DB}`")
+    cur.execute(f"USE `{BENCH_DB}`")
+    for stmt in SCHEMA:
+        cur.execute(stmt)
+
+    member_rows, day_rows, scan_rows = [], [], []
+    for mid in range(1, members + 1):
+        used = 0
+        for back in range(days, 0, -1):
+            day = today - timedelta(days=back)
+            eaten = {s: int(rng.random() < 0.8) for s in SLOTS}
+            consumed = int(any(eaten.values()))
+            used += consumed
+            day_rows.append((mid, day, *eaten.values(), consumed))
+            for s, ate in eaten.items():
+                if ate:
+                    at = datetime.combine(day, SLOT_TIMES[s]) + timedelta(seconds=rng.randrange(3600))
+                    scan_rows.append((mid, "seed", s, day, 1, "OK", at))
+        member_rows.append((mid, f"Student {mid}", f"B{mid:05d}", ",".join(SLOTS), used, max(0, paid_days - used)))
+
+    _insert(
+        cur,
+        """
+        INSERT INTO members(id,name,roll_or_id,allowed_slots,used_days,remaining,carry_forward)
+        VALUES(%s,%s,%s,%s,%s,%s,0)
+        """,
+        member_rows,
+    )
+    _insert(
+        cur,
+        """
+        INSERT INTO mess_days(member_id,date,morning,afternoon,evening,night,consumed)
+        VALUES(%s,%s,%s,%s,%s,%s,%s)
+        """,
+        day_rows,
+    )
+    _insert(
+        cur,
+        """
+        INSERT INTO scans(member_id,token,slot,valid_date,success,message,scanned_at)
+        VALUES(%s,%s,%s,%s,%s,%s,%s)
+        """,
+        scan_rows,
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+    return {"members": len(member_rows), "mess_days": len(day_rows), "scans": len(scan_rows)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the benchmark database")
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    counts = seed(args.members, args.days, args.seed)
+    print(f"Seeded {BENCH_DB}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# Gunicorn settings for the canteen app.
+#
+# Each worker process holds its own DB pool, so the server opens up to
+# workers x DB_POOL_SIZE MySQL connections; keep that under max_connections.
+#
+# More than one worker (or more than one instance) needs CACHE_BACKEND=redis
+# so slot tokens, QR export jobs and live events are shared. Photos and
+# exports are written to local disk: with several instances, static/members,
+# static/menu and QR_EXPORT_DIR must sit on shared storage.
+import importlib.util
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "gthread"      # SSE streams hold a thread each
+
+# With the in-process memory cache, every worker would hold its own slot
+# tokens, export jobs and event subscribers, so it is one worker unless
+# the cache is shared. WEB_CONCURRENCY (set by some hosts) is capped.
+# Without the redis package the app falls back to memory, so that counts too.
+shared_cache = (
+    os.getenv("CACHE_BACKEND", "memory").lower() == "redis"
+    and importlib.util.find_spec("redis") is not None
+)
+requested_workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() if shared_cache else 1))
+workers = requested_workers if shared_cache else 1
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 20
+keepalive = 5
+
+# Each worker imports the app itself so pools, threads and the render
+# process pool are never shared across a fork.
+preload_app = False
+
+
+def on_starting(server):
+    if workers < requested_workers:
+        server.log.error(
+            "WEB_CONCURRENCY=%d needs CACHE_BACKEND=redis and the redis package "
+            "(the memory cache is per process); starting 1 worker", requested_workers,
+        )
@@ -0,0 +1,16 @@
+# ================================
+#  QR PNG RENDERING
+#  Kept out of app.py so the QR export process pool can run in
+#  fresh forkserver children that import only this module, not
+#  the app with its DB pool, caches and background threads.
+# ================================
+from io import BytesIO
+
+import qrcode
+
+
+def render_png(url):
+    img = qrcode.make(url)
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()